@@ -3,7 +3,6 @@ import time
 import logging
 from datetime import datetime, timedelta
 from django.utils import timezone
-from django.core.cache import cache
 from django.db import connection
 from celery.task.control import inspect
 from .models import SystemHealthMetrics, MLModelMetrics, PerformanceMetric, UserActivity
@@ -80,7 +79,7 @@ class MetricsCollector:
                 return None
             
             # Obtener distribución de clases de predicciones recientes
-            recent_predictions = cache.get(model_monitor.predictions_key, [])
+            recent_predictions = model_monitor.get_recent_predictions()
             class_distribution = {}
             processing_times = []
             
@@ -7,33 +7,67 @@ import numpy as np
 import tensorflow as tf
 import logging
 import os
-from typing import Dict, List, Tuple, Optional
+import hashlib
+import time
+from typing import Dict, List, Tuple, Optional, Union
 import json
 from pathlib import Path
-import pickle
-from scipy.stats import mode
-from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+from sklearn.metrics import precision_recall_fscore_support
 import threading
+import queue
 import concurrent.futures
+from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
 
+# Un solo hilo inter-op por proceso: con varios workers de Gunicorn/Celery en la
+# misma máquina, el pool por defecto (un hilo por núcleo) sobresuscribe la CPU
+try:
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    tf.config.threading.set_intra_op_parallelism_threads(int(os.environ.get('OMP_NUM_THREADS', '4')))
+except RuntimeError:
+    # El runtime de TensorFlow ya fue inicializado por otro módulo
+    logger.debug("Configuración de hilos de TensorFlow ya fijada, se mantiene la actual")
+
+
+def _json_default(value):
+    """Serializa tipos numpy que puedan colarse en la metadata del ensemble"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
 class ModelEnsemble:
     """
     Sistema de ensemble que combina múltiples modelos
     para obtener predicciones más robustas y confiables
     """
 
+    PREDICTION_CACHE_TIMEOUT = 86400  # 24 horas, igual que MLCache
+
     def __init__(self, model_dir: str):
         self.model_dir = Path(model_dir)
-        self.models = {}
+        # Nombre -> modelo cargado, o su Path mientras la carga esté diferida
+        self.models: Dict[str, Union[Path, tf.keras.Model]] = {}
         self.model_weights = {}
         self.is_loaded = False
         self.ensemble_metadata = {}
-
-    def load_models(self) -> bool:
+        self.models_signature = ""
+        self.batcher = None
+        self.fused_model = None
+        self.fused_names = []
+        self._models_materialized = False
+        self._load_lock = threading.Lock()
+
+    def load_models(self, preload: bool = False) -> bool:
         """
-        Carga todos los modelos disponibles en el directorio
+        Registra los modelos disponibles en el directorio
+
+        Args:
+            preload: Cargar los pesos de inmediato; si es False la carga se
+                difiere hasta la primera inferencia
         """
         try:
             model_files = list(self.model_dir.glob("*.keras")) + list(self.model_dir.glob("*.h5"))
@@ -42,49 +76,124 @@ class ModelEnsemble:
                 logger.warning(f"No se encontraron modelos en {self.model_dir}")
                 return False
 
-            logger.info(f"🔄 Cargando {len(model_files)} modelos para ensemble...")
-
             for model_file in model_files:
-                try:
-                    model_name = model_file.stem
-                    logger.info(f"Cargando modelo: {model_name}")
+                self.models[model_file.stem] = model_file
+
+                # Peso inicial igual para todos los modelos
+                self.model_weights[model_file.stem] = 1.0 / len(model_files)
 
-                    # Cargar modelo
-                    model = tf.keras.models.load_model(str(model_file), compile=False)
-                    self.models[model_name] = model
+            self._models_materialized = False
 
-                    # Peso inicial igual para todos los modelos
-                    self.model_weights[model_name] = 1.0 / len(model_files)
+            if preload:
+                self._ensure_models_loaded()
+                if not self.models:
+                    return False
+            else:
+                logger.info(f"🔄 {len(self.models)} modelos registrados, carga diferida hasta la primera inferencia")
+
+            self.is_loaded = True
+            self._update_models_signature()
+
+            # Cargar metadata si existe
+            self._load_ensemble_metadata()
+
+            return True
+
+        except Exception as e:
+            logger.error(f"Error cargando ensemble: {e}")
+            return False
 
+    def _ensure_models_loaded(self):
+        """Carga los modelos pendientes, une el grafo y lo precalienta una sola vez"""
+        if self._models_materialized:
+            return
+
+        with self._load_lock:
+            if self._models_materialized:
+                return
+
+            logger.info(f"🔄 Cargando {len(self.models)} modelos para ensemble...")
+
+            for model_name, model_file in list(self.models.items()):
+                if not isinstance(model_file, Path):
+                    continue
+                try:
+                    logger.info(f"Cargando modelo: {model_name}")
+                    self.models[model_name] = tf.keras.models.load_model(str(model_file), compile=False)
                     logger.info(f"✅ Modelo {model_name} cargado exitosamente")
 
                 except Exception as e:
                     logger.error(f"❌ Error cargando {model_file}: {e}")
-                    continue
+                    del self.models[model_name]
+                    self.model_weights.pop(model_name, None)
 
             if not self.models:
                 logger.error("No se pudo cargar ningún modelo")
-                return False
+                return
 
-            self.is_loaded = True
+            self._update_models_signature()
             logger.info(f"🎯 Ensemble listo con {len(self.models)} modelos")
 
-            # Cargar metadata si existe
-            self._load_ensemble_metadata()
+            # El conjunto de modelos queda fijo: unirlos en un solo grafo
+            self._build_fused_model()
+            self._models_materialized = True
 
-            return True
+            # Trazar los grafos ahora y no en el primer request
+            self._warmup()
 
+    def _update_models_signature(self):
+        self.models_signature = hashlib.blake2b(
+            "|".join(sorted(self.models)).encode(), digest_size=8
+        ).hexdigest()
+
+    def _build_fused_model(self):
+        """
+        Une todos los modelos en un único grafo con una salida por modelo,
+        de modo que cada inferencia es un solo lanzamiento en TensorFlow
+        """
+        self.fused_model = None
+        self.fused_names = list(self.models.keys())
+
+        try:
+            input_shapes = {tuple(model.input_shape[1:]) for model in self.models.values()}
+            if len(self.models) < 2 or len(input_shapes) != 1:
+                return
+
+            input_shape = input_shapes.pop()
+            models = [self.models[name] for name in self.fused_names]
+
+            # Se llama a cada modelo dentro de la misma tf.function en lugar de
+            # armar un keras.Model, que rechaza submodelos con nombres repetidos.
+            # Sin jit_compile: XLA compilaría un ejecutable por cada tamaño de lote
+            # (micro-batcher, último lote de la evaluación) en pleno request; el
+            # grafo con lote None se traza una sola vez en el warmup
+            self.fused_model = tf.function(
+                lambda batch: [model(batch, training=False) for model in models],
+                input_signature=[tf.TensorSpec((None,) + input_shape, tf.float32)]
+            )
+            logger.info(f"🔗 {len(self.fused_names)} modelos unidos en un solo grafo")
         except Exception as e:
-            logger.error(f"Error cargando ensemble: {e}")
-            return False
+            logger.warning(f"No se pudo unir los modelos, se ejecutarán por separado: {e}")
+
+    def _warmup(self):
+        """Ejecuta una inferencia inicial con ceros en cada modelo"""
+        for model_name, model in self.models.items():
+            try:
+                dummy = np.zeros((1,) + tuple(model.input_shape[1:]), dtype=np.float32)
+                model.predict(dummy, verbose=0)
+            except Exception as e:
+                logger.warning(f"No se pudo precalentar {model_name}: {e}")
+
+        if self.fused_model is not None:
+            dummy = np.zeros((1,) + tuple(self.models[self.fused_names[0]].input_shape[1:]), dtype=np.float32)
+            self._run_models(dummy)
 
     def _load_ensemble_metadata(self):
         """Carga metadata del ensemble si existe"""
         metadata_file = self.model_dir / "ensemble_metadata.json"
         if metadata_file.exists():
             try:
-                with open(metadata_file, 'r') as f:
-                    self.ensemble_metadata = json.load(f)
+                self.ensemble_metadata = json.loads(metadata_file.read_bytes())
 
                 # Actualizar pesos si están en metadata
                 if 'model_weights' in self.ensemble_metadata:
@@ -96,13 +205,15 @@ class ModelEnsemble:
             except Exception as e:
                 logger.error(f"Error cargando metadata: {e}")
 
-    def predict_ensemble(self, image: np.ndarray, method: str = "weighted_average") -> Dict:
+    def predict_ensemble(self, image: np.ndarray, method: str = "weighted_average",
+                         use_cache: bool = False) -> Dict:
         """
         Realiza predicción usando ensemble de modelos
 
         Args:
             image: Imagen de entrada
             method: Método de ensemble ("weighted_average", "majority_vote", "max_confidence")
+            use_cache: Reutilizar la predicción si la misma imagen ya fue evaluada
 
         Returns:
             Diccionario con predicción y métricas de confianza
@@ -110,41 +221,27 @@ class ModelEnsemble:
         if not self.is_loaded:
             raise ValueError("Ensemble no está cargado. Ejecutar load_models() primero.")
 
-        try:
-            # Preparar imagen
-            if len(image.shape) == 3:
-                image_batch = np.expand_dims(image, axis=0)
-            else:
-                image_batch = image
+        cache_key = None
+        if use_cache:
+            cache_key = self._prediction_cache_key(image, method)
+            cached_result = cache.get(cache_key)
+            if cached_result is not None:
+                logger.info("Usando predicción ensemble desde cache")
+                return cached_result
 
-            # Obtener predicciones de todos los modelos
-            predictions = {}
-            confidences = {}
+        try:
+            image_batch = self._prepare_batch(image)
 
             logger.info(f"🔄 Ejecutando ensemble con {len(self.models)} modelos...")
 
-            for model_name, model in self.models.items():
-                try:
-                    pred = model.predict(image_batch, verbose=0)[0]
-                    predictions[model_name] = pred
-                    confidences[model_name] = float(np.max(pred))
-
-                except Exception as e:
-                    logger.error(f"Error en predicción de {model_name}: {e}")
-                    continue
-
-            if not predictions:
-                raise ValueError("Ningún modelo pudo realizar predicciones")
+            # Obtener predicciones de todos los modelos
+            if self.batcher is not None and image_batch.shape[0] == 1:
+                predictions, confidences = self.batcher.submit(image_batch[0]).result()
+            else:
+                predictions, confidences = self._collect_predictions(image_batch)
 
             # Aplicar método de ensemble seleccionado
-            if method == "weighted_average":
-                result = self._weighted_average_ensemble(predictions, confidences)
-            elif method == "majority_vote":
-                result = self._majority_vote_ensemble(predictions)
-            elif method == "max_confidence":
-                result = self._max_confidence_ensemble(predictions, confidences)
-            else:
-                raise ValueError(f"Método de ensemble desconocido: {method}")
+            result = self._combine_predictions(predictions, confidences, method)
 
             # Agregar información del ensemble
             result['ensemble_info'] = {
@@ -156,12 +253,79 @@ class ModelEnsemble:
 
             logger.info(f"✅ Ensemble completado: Clase={result['prediction']}, Confianza={result['confidence']:.3f}")
 
+            if cache_key is not None:
+                cache.set(cache_key, result, timeout=self.PREDICTION_CACHE_TIMEOUT)
+
             return result
 
         except Exception as e:
             logger.error(f"Error en predicción ensemble: {e}")
             raise
 
+    def _prediction_cache_key(self, image: np.ndarray, method: str) -> str:
+        """Clave de cache basada en el contenido de la imagen y los modelos cargados"""
+        image = np.ascontiguousarray(image)
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(f"{image.shape}{image.dtype.str}".encode())
+        hasher.update(image.data)
+        return f"ml_pred_ensemble_{method}_{self.models_signature}_{hasher.hexdigest()}"
+
+    @staticmethod
+    def _prepare_batch(image: np.ndarray) -> np.ndarray:
+        """Agrega la dimensión de lote si la imagen viene sola"""
+        if len(image.shape) == 3:
+            return np.expand_dims(image, axis=0)
+        return image
+
+    def _run_models(self, image_batch: np.ndarray) -> Dict[str, np.ndarray]:
+        """Ejecuta cada modelo una sola vez sobre el lote completo"""
+        self._ensure_models_loaded()
+
+        if self.fused_model is not None:
+            try:
+                fused_outputs = self.fused_model(tf.convert_to_tensor(image_batch, dtype=tf.float32))
+                return {name: out.numpy() for name, out in zip(self.fused_names, fused_outputs)}
+            except Exception as e:
+                # Solo esta llamada vuelve a la ejecución por modelo, que aísla los
+                # fallos individuales; el grafo unido se conserva para las siguientes
+                logger.warning(f"Grafo unido falló, se ejecutan los modelos por separado: {e}")
+
+        outputs = {}
+
+        for model_name, model in self.models.items():
+            try:
+                outputs[model_name] = model.predict(image_batch, verbose=0)
+
+            except Exception as e:
+                logger.error(f"Error en predicción de {model_name}: {e}")
+                continue
+
+        if not outputs:
+            raise ValueError("Ningún modelo pudo realizar predicciones")
+
+        return outputs
+
+    def _collect_predictions(self, image_batch: np.ndarray, index: int = 0) -> Tuple[Dict, Dict]:
+        """Ejecuta todos los modelos sobre el lote y retorna predicciones y confianzas"""
+        return self._split_outputs(self._run_models(image_batch), index)
+
+    @staticmethod
+    def _split_outputs(outputs: Dict[str, np.ndarray], index: int) -> Tuple[Dict, Dict]:
+        """Extrae predicciones y confianzas de una imagen del lote"""
+        predictions = {name: out[index] for name, out in outputs.items()}
+        confidences = {name: float(np.max(pred)) for name, pred in predictions.items()}
+        return predictions, confidences
+
+    def _combine_predictions(self, predictions: Dict, confidences: Dict, method: str) -> Dict:
+        """Combina las predicciones individuales con el método de ensemble indicado"""
+        if method == "weighted_average":
+            return self._weighted_average_ensemble(predictions, confidences)
+        elif method == "majority_vote":
+            return self._majority_vote_ensemble(predictions)
+        elif method == "max_confidence":
+            return self._max_confidence_ensemble(predictions, confidences)
+        raise ValueError(f"Método de ensemble desconocido: {method}")
+
     def _weighted_average_ensemble(self, predictions: Dict, confidences: Dict) -> Dict:
         """Ensemble por promedio ponderado"""
 
@@ -197,13 +361,10 @@ class ModelEnsemble:
         base_confidence = float(np.max(ensemble_probs))
 
         # Bonus de confianza por consenso
-        agreement_scores = []
-        for pred in predictions.values():
-            pred_class = np.argmax(pred)
-            if pred_class == prediction_class:
-                agreement_scores.append(np.max(pred))
+        preds_stack = np.stack(list(predictions.values()))
+        agreement_count = int((preds_stack.argmax(axis=1) == prediction_class).sum())
 
-        consensus_bonus = len(agreement_scores) / len(predictions) * 0.1
+        consensus_bonus = agreement_count / len(predictions) * 0.1
         enhanced_confidence = min(0.99, base_confidence + consensus_bonus)
 
         return {
@@ -211,7 +372,7 @@ class ModelEnsemble:
             'probabilities': ensemble_probs.tolist(),
             'confidence': enhanced_confidence,
             'base_confidence': base_confidence,
-            'consensus_rate': len(agreement_scores) / len(predictions),
+            'consensus_rate': agreement_count / len(predictions),
             'method_details': {
                 'type': 'weighted_average',
                 'dynamic_weights': dynamic_weights
@@ -229,10 +390,11 @@ class ModelEnsemble:
             votes.append(np.argmax(pred))
             all_probs.append(pred)
 
-        # Voto mayoritario
-        vote_result = mode(votes, keepdims=True)
-        majority_class = int(vote_result.mode[0])
-        vote_count = int(vote_result.count[0])
+        # Voto mayoritario (en empate gana la clase menor, como scipy.stats.mode)
+        vote_classes, vote_counts = np.unique(votes, return_counts=True)
+        winner_idx = int(np.argmax(vote_counts))
+        majority_class = int(vote_classes[winner_idx])
+        vote_count = int(vote_counts[winner_idx])
 
         # Calcular confianza basada en consenso
         consensus_rate = vote_count / len(votes)
@@ -255,7 +417,7 @@ class ModelEnsemble:
             'probabilities': ensemble_probs.tolist(),
             'confidence': float(enhanced_confidence),
             'consensus_rate': consensus_rate,
-            'vote_distribution': {str(i): votes.count(i) for i in set(votes)},
+            'vote_distribution': {str(int(c)): int(n) for c, n in zip(vote_classes, vote_counts)},
             'method_details': {
                 'type': 'majority_vote',
                 'total_votes': len(votes),
@@ -267,20 +429,18 @@ class ModelEnsemble:
         """Ensemble seleccionando la predicción con mayor confianza"""
 
         # Encontrar modelo con mayor confianza
-        best_model = max(confidences.keys(), key=lambda x: confidences[x])
+        model_names = list(predictions.keys())
+        conf_arr = np.fromiter((confidences[name] for name in model_names),
+                               dtype=np.float64, count=len(model_names))
+        best_idx = int(conf_arr.argmax())
+        best_model = model_names[best_idx]
         best_prediction = predictions[best_model]
         best_confidence = confidences[best_model]
 
         # Verificar si otros modelos están de acuerdo
-        best_class = np.argmax(best_prediction)
-        agreement_count = 0
-        confidence_sum = 0
-
-        for model_name, pred in predictions.items():
-            pred_class = np.argmax(pred)
-            if pred_class == best_class:
-                agreement_count += 1
-                confidence_sum += np.max(pred)
+        preds_stack = np.stack([predictions[name] for name in model_names])
+        best_class = int(preds_stack[best_idx].argmax())
+        agreement_count = int((preds_stack.argmax(axis=1) == best_class).sum())
 
         # Bonus por acuerdo entre modelos
         agreement_bonus = (agreement_count / len(predictions)) * 0.05
@@ -307,43 +467,77 @@ class ModelEnsemble:
         if not self.is_loaded:
             raise ValueError("Ensemble no está cargado")
 
+        n_images = len(test_images)
+        methods = ('weighted_average', 'majority_vote', 'max_confidence')
         results = {
-            'weighted_average': {'predictions': [], 'confidences': []},
-            'majority_vote': {'predictions': [], 'confidences': []},
-            'max_confidence': {'predictions': [], 'confidences': []}
+            method: {
+                'predictions': np.full(n_images, -1, dtype=np.int16),
+                'confidences': np.zeros(n_images, dtype=np.float32)
+            }
+            for method in methods
         }
 
-        logger.info(f"🔄 Evaluando ensemble en {len(test_images)} imágenes...")
+        # Los modelos ya paralelizan internamente (intra-op); limitar los hilos
+        # de inferencia para no sobresuscribir los núcleos disponibles
+        n_workers = max(1, min(4, (os.cpu_count() or 1) // max(1, len(self.models))))
+        image_queue = queue.Queue(maxsize=n_workers * 2)
+        progress = {'done': 0}
+        progress_lock = threading.Lock()
+
+        logger.info(f"🔄 Evaluando ensemble en {n_images} imágenes con {n_workers} hilos...")
+
+        def _producer():
+            try:
+                for i, image in enumerate(test_images):
+                    image_queue.put((i, self._prepare_batch(image)))
+            finally:
+                for _ in range(n_workers):
+                    image_queue.put(None)
 
-        for i, image in enumerate(test_images):
-            if i % 10 == 0:
-                logger.info(f"Progreso evaluación: {i}/{len(test_images)}")
+        def _worker():
+            while (item := image_queue.get()) is not None:
+                i, image_batch = item
 
-            for method in results.keys():
+                # Una sola pasada por los modelos, reutilizada por los tres métodos
                 try:
-                    result = self.predict_ensemble(image, method=method)
-                    results[method]['predictions'].append(result['prediction'])
-                    results[method]['confidences'].append(result['confidence'])
+                    predictions, confidences = self._collect_predictions(image_batch)
                 except Exception as e:
-                    logger.error(f"Error evaluando método {method}: {e}")
-                    results[method]['predictions'].append(-1)
-                    results[method]['confidences'].append(0.0)
+                    logger.error(f"Error evaluando imagen {i}: {e}")
+                    predictions = None
+
+                if predictions is not None:
+                    for method in methods:
+                        try:
+                            result = self._combine_predictions(predictions, confidences, method)
+                            results[method]['predictions'][i] = result['prediction']
+                            results[method]['confidences'][i] = result['confidence']
+                        except Exception as e:
+                            logger.error(f"Error evaluando método {method}: {e}")
+
+                with progress_lock:
+                    progress['done'] += 1
+                    if progress['done'] % 10 == 0:
+                        logger.info(f"Progreso evaluación: {progress['done']}/{n_images}")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers + 1) as executor:
+            futures = [executor.submit(_producer)]
+            futures += [executor.submit(_worker) for _ in range(n_workers)]
+            for future in futures:
+                future.result()
 
         # Calcular métricas para cada método
         performance_metrics = {}
+        true_labels = np.asarray(true_labels)
 
         for method, data in results.items():
-            predictions = np.array(data['predictions'])
-            confidences = np.array(data['confidences'])
-
             # Filtrar predicciones válidas
-            valid_mask = predictions >= 0
-            valid_predictions = predictions[valid_mask]
+            valid_mask = data['predictions'] >= 0
+            valid_predictions = data['predictions'][valid_mask]
             valid_true_labels = true_labels[valid_mask]
-            valid_confidences = confidences[valid_mask]
+            valid_confidences = data['confidences'][valid_mask]
 
             if len(valid_predictions) > 0:
-                accuracy = accuracy_score(valid_true_labels, valid_predictions)
+                accuracy = np.mean(valid_predictions == valid_true_labels)
                 precision, recall, f1, _ = precision_recall_fscore_support(
                     valid_true_labels, valid_predictions, average='weighted', zero_division=0
                 )
@@ -356,7 +550,7 @@ class ModelEnsemble:
                     'mean_confidence': float(np.mean(valid_confidences)),
                     'std_confidence': float(np.std(valid_confidences)),
                     'valid_samples': len(valid_predictions),
-                    'total_samples': len(predictions)
+                    'total_samples': n_images
                 }
             else:
                 performance_metrics[method] = {
@@ -367,7 +561,7 @@ class ModelEnsemble:
                     'mean_confidence': 0.0,
                     'std_confidence': 0.0,
                     'valid_samples': 0,
-                    'total_samples': len(predictions)
+                    'total_samples': n_images
                 }
 
         logger.info("✅ Evaluación del ensemble completada")
@@ -395,14 +589,69 @@ class ModelEnsemble:
 
             # Guardar metadata
             metadata_file = self.model_dir / "ensemble_metadata.json"
-            with open(metadata_file, 'w') as f:
-                json.dump(self.ensemble_metadata, f, indent=2)
+            metadata_file.write_text(
+                json.dumps(self.ensemble_metadata, indent=2, default=_json_default)
+            )
 
             logger.info("✅ Pesos del ensemble actualizados")
 
         except Exception as e:
             logger.error(f"Error actualizando pesos: {e}")
 
+class EnsembleMicroBatcher:
+    """
+    Agrupa las imágenes de requests concurrentes en micro-lotes
+    para ejecutar cada modelo una sola vez por lote
+    """
+
+    def __init__(self, ensemble: ModelEnsemble, max_batch: int = 16, max_wait: float = 0.005):
+        self.ensemble = ensemble
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._inbox = queue.Queue()
+        self._thread = threading.Thread(target=self._batcher_loop, name="ensemble-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image: np.ndarray) -> concurrent.futures.Future:
+        """Encola una imagen; el Future resuelve a (predicciones, confianzas)"""
+        future = concurrent.futures.Future()
+        self._inbox.put((image, future))
+        return future
+
+    def _batcher_loop(self):
+        while True:
+            items = [self._inbox.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._inbox.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._run_batch(items)
+
+    def _run_batch(self, items: List[Tuple[np.ndarray, concurrent.futures.Future]]):
+        # Solo se pueden apilar imágenes con la misma forma
+        groups = {}
+        for image, future in items:
+            groups.setdefault(image.shape, []).append((image, future))
+
+        for group in groups.values():
+            try:
+                outputs = self.ensemble._run_models(np.stack([image for image, _ in group]))
+            except Exception as e:
+                for _, future in group:
+                    future.set_exception(e)
+                continue
+
+            for index, (_, future) in enumerate(group):
+                future.set_result(ModelEnsemble._split_outputs(outputs, index))
+
+
 # Clase de utilidad para gestión fácil
 class EnsembleManager:
     """Gestor simplificado del sistema de ensemble"""
@@ -410,26 +659,54 @@ class EnsembleManager:
     def __init__(self, model_dir: str):
         self.ensemble = ModelEnsemble(model_dir)
         self.is_ready = False
+        self.use_micro_batching = os.environ.get('ENSEMBLE_MICRO_BATCHING', 'False').lower() == 'true'
 
-    def setup(self) -> bool:
+    def setup(self, preload: bool = False) -> bool:
         """Configura el ensemble automáticamente"""
         try:
-            success = self.ensemble.load_models()
+            success = self.ensemble.load_models(preload=preload)
             self.is_ready = success
+            if success and self.use_micro_batching and self.ensemble.batcher is None:
+                self.ensemble.batcher = EnsembleMicroBatcher(self.ensemble)
             return success
         except Exception as e:
             logger.error(f"Error configurando ensemble: {e}")
             return False
 
-    def predict(self, image: np.ndarray, method: str = "weighted_average") -> Dict:
+    def predict(self, image: np.ndarray, method: str = "weighted_average",
+                use_cache: bool = False) -> Dict:
         """Predicción simplificada"""
         if not self.is_ready:
             raise ValueError("Ensemble no está listo. Ejecutar setup() primero.")
 
-        return self.ensemble.predict_ensemble(image, method=method)
+        return self.ensemble.predict_ensemble(image, method=method, use_cache=use_cache)
 
     def get_best_method(self) -> str:
         """Retorna el mejor método basado en evaluaciones previas"""
         if 'recommended_method' in self.ensemble.ensemble_metadata:
             return self.ensemble.ensemble_metadata['recommended_method']
-        return "weighted_average"  # Por defecto
\ No newline at end of file
+        return "weighted_average"  # Por defecto
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_ensemble_manager(model_dir: str) -> EnsembleManager:
+    """
+    Retorna un EnsembleManager compartido por proceso para el directorio dado,
+    de modo que los modelos se cargan una sola vez y los requests concurrentes
+    comparten el micro-batcher
+    """
+    with _managers_lock:
+        manager = _managers.get(model_dir)
+        if manager is None:
+            manager = EnsembleManager(model_dir)
+            # Carga inmediata: así is_ready refleja si los modelos se pudieron
+            # cargar y la vista puede usar el sistema individual como respaldo
+            manager.setup(preload=True)
+            # Solo se comparte si cargó: tras un fallo (p. ej. I/O transitorio)
+            # la siguiente petición vuelve a intentarlo
+            if manager.is_ready:
+                _managers[model_dir] = manager
+        return manager
@@ -1,17 +1,120 @@
 import numpy as np
 import cv2
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-from matplotlib.colors import LinearSegmentedColormap
 import base64
+import hashlib
+import logging
+import os
+import threading
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
 from PIL import Image
-from io import BytesIO
-from typing import Tuple, Dict, Optional, Union
-import warnings
+from typing import Tuple, Dict, List, Optional, Sequence, Union
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from .clinical_colormaps import get_colormap_lut, get_colormap_stops
+from .utils import fast_percentiles
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=8)
+def _build_colorbar_svg(colormap_type: str, width: int, height: int) -> str:
+    """
+    SVG colorbar for a colormap; depends only on its arguments, so it is
+    built once and reused for every patient
+    """
+    lut = get_colormap_lut(colormap_type)
+    
+    # Create SVG root con mayor altura para etiquetas médicas
+    svg = ET.Element('svg', {
+        'width': str(width),
+        'height': str(height + 50),
+        'viewBox': f'0 0 {width} {height + 50}',
+        'xmlns': 'http://www.w3.org/2000/svg',
+        'style': 'background: white; border-radius: 8px;'
+    })
+    
+    # 🎯 TÍTULO MÉDICO
+    title = ET.SubElement(svg, 'text', {
+        'x': str(width//2), 'y': '15',
+        'font-family': 'Arial, sans-serif', 'font-size': '14', 'font-weight': 'bold',
+        'fill': '#2d3748', 'text-anchor': 'middle'
+    })
+    title.text = 'Mapa de Activación Neural - Análisis Clínico'
+    
+    # Create gradient definition
+    defs = ET.SubElement(svg, 'defs')
+    gradient = ET.SubElement(defs, 'linearGradient', {
+        'id': 'medicalGradient',
+        'x1': '0%', 'y1': '0%', 'x2': '100%', 'y2': '0%'
+    })
+    
+    # Color stops: el navegador interpola linealmente entre ellos, así que
+    # bastan los puntos de control del mapa (o 16 muestras para inferno/viridis)
+    for position in get_colormap_stops(colormap_type):
+        red, green, blue = lut[min(int(position * 256), 255), :3]
+        color_hex = f"#{red:02x}{green:02x}{blue:02x}"
+        
+        ET.SubElement(gradient, 'stop', {
+            'offset': f'{position*100}%',
+            'stop-color': color_hex,
+            'stop-opacity': '1'
+        })
+    
+    # Gradient rectangle con bordes redondeados
+    ET.SubElement(svg, 'rect', {
+        'x': '30', 'y': '25',
+        'width': str(width-60), 'height': str(height-35),
+        'fill': 'url(#medicalGradient)',
+        'stroke': '#4a5568', 'stroke-width': '2',
+        'rx': '4', 'ry': '4'
+    })
+    
+    # 🏥 ETIQUETAS MÉDICAS MEJORADAS
+    # Etiqueta izquierda
+    left_label = ET.SubElement(svg, 'text', {
+        'x': '30', 'y': str(height + 40),
+        'font-family': 'Arial, sans-serif', 'font-size': '13', 'font-weight': '600',
+        'fill': '#4a5568', 'text-anchor': 'start'
+    })
+    left_label.text = '← Baja Activación'
+    
+    # Etiqueta central con flecha bidireccional
+    center_label = ET.SubElement(svg, 'text', {
+        'x': str(width//2), 'y': str(height + 40),
+        'font-family': 'Arial, sans-serif', 'font-size': '12', 'font-weight': '500',
+        'fill': '#2d3748', 'text-anchor': 'middle'
+    })
+    center_label.text = 'Intensidad de Atención IA'
+    
+    # Etiqueta derecha
+    right_label = ET.SubElement(svg, 'text', {
+        'x': str(width-30), 'y': str(height + 40),
+        'font-family': 'Arial, sans-serif', 'font-size': '13', 'font-weight': '600',
+        'fill': '#4a5568', 'text-anchor': 'end'
+    })
+    right_label.text = 'Alta Activación →'
+    
+    # 📈 MARCADORES DE ESCALA
+    for i, (pos, label) in enumerate([(0, '0%'), (0.25, '25%'), (0.5, '50%'), (0.75, '75%'), (1, '100%')]):
+        x_pos = 30 + (width-60) * pos
+        # Línea de tick
+        ET.SubElement(svg, 'line', {
+            'x1': str(x_pos), 'y1': str(height - 10),
+            'x2': str(x_pos), 'y2': str(height - 5),
+            'stroke': '#4a5568', 'stroke-width': '1.5'
+        })
+        # Etiqueta de porcentaje
+        tick_label = ET.SubElement(svg, 'text', {
+            'x': str(x_pos), 'y': str(height + 15),
+            'font-family': 'Arial, sans-serif', 'font-size': '10',
+            'fill': '#718096', 'text-anchor': 'middle'
+        })
+        tick_label.text = label
+    
+    return ET.tostring(svg, encoding='unicode')
 
-# Suppress matplotlib warnings
-warnings.filterwarnings('ignore', category=UserWarning)
 
 class MedicalGradCAMEnhancer:
     """
@@ -30,10 +133,27 @@ class MedicalGradCAMEnhancer:
     - Comprehensive metadata tracking
     """
     
+    CLINICAL_COLORMAPS = ('inferno', 'jet', 'viridis')
+    MASK_CACHE_SIZE = 16
+    # zlib level for exported PNGs: PIL's optimize=True at level 6 cost ~0.4 s
+    # per RGBA overlay; level 3 is ~15x faster for ~25% larger files
+    PNG_COMPRESSION_LEVEL = 3
+    
     def __init__(self):
         self.input_size = (96, 96)  # Original Grad-CAM size
         self.output_size = (512, 512)  # High-resolution output
+        # Coordinate grids for the fixed output size, reused by every mask build
+        self._y_grid, self._x_grid = (axis.astype(np.float32) for axis in np.ogrid[:512, :512])
         self.default_alpha = 0.35  # Clinical transparency
+        # Precomputed 256-entry uint8 RGBA lookup tables, one per colormap
+        self._luts = {name: get_colormap_lut(name) for name in self.CLINICAL_COLORMAPS}
+        # Same tables shaped (256, 1, 4) for cv2.LUT on 4-channel index images
+        self._cv_luts = {name: lut.reshape(256, 1, 4) for name, lut in self._luts.items()}
+        # Structuring element for the noise-removal opening
+        self._ellipse3 = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        # LRU of retina masks keyed by image content (re-scoring the same fundus)
+        self._mask_cache = OrderedDict()
+        self._mask_cache_lock = threading.Lock()
         
     def enhance_gradcam(
         self, 
@@ -77,33 +197,34 @@ class MedicalGradCAMEnhancer:
         result = {}
         
         # STEP 1: Robust percentile normalization
-        print(f"🔬 Step 1: Robust normalization ({percentile_range[0]}-{percentile_range[1]} percentiles)")
+        logger.debug("🔬 Step 1: Robust normalization (%s-%s percentiles)", percentile_range[0], percentile_range[1])
         heatmap_normalized = self._robust_normalize(heatmap_raw, percentile_range)
         
-        # STEP 2: Bicubic upsampling to high resolution
-        print(f"🔬 Step 2: Bicubic interpolation to {target_size}x{target_size}")
-        heatmap_hires = self._bicubic_upscale(heatmap_normalized, (target_size, target_size))
+        # STEP 2: Gaussian blur for smooth transitions, at the heatmap's native
+        # resolution (sigma scaled down) so it runs on far fewer pixels
+        blur_scale = self._blur_scale(heatmap_normalized.shape, target_size)
+        logger.debug("🔬 Step 2: Gaussian blur (kernel=%s, scale=%.3f)", gaussian_kernel, blur_scale)
+        heatmap_blurred = self._gaussian_smooth(heatmap_normalized, gaussian_kernel, blur_scale)
         
-        # STEP 3: Gaussian blur for smooth transitions
-        print(f"🔬 Step 3: Gaussian blur (kernel={gaussian_kernel})")
-        heatmap_smooth = self._gaussian_smooth(heatmap_hires, gaussian_kernel)
+        # STEP 3: Bicubic upsampling to high resolution
+        logger.debug("🔬 Step 3: Bicubic interpolation to %sx%s", target_size, target_size)
+        heatmap_smooth = self._bicubic_upscale(heatmap_blurred, (target_size, target_size))
         
         # STEP 4: Circular retina masking
-        print("🔬 Step 4: Circular retina masking")
+        logger.debug("🔬 Step 4: Circular retina masking")
         mask_info = self._create_retina_mask(retina_array)
         heatmap_masked = self._apply_retina_mask(heatmap_smooth, mask_info['mask'])
         
         # STEP 5: Noise elimination
-        print("🔬 Step 5: Noise elimination")
+        logger.debug("🔬 Step 5: Noise elimination")
         heatmap_clean = self._eliminate_noise(heatmap_masked, threshold=0.05)
         
         # STEP 6: Clinical colormap application
-        print(f"🔬 Step 6: Clinical colormap ({colormap_type})")
-        colormap = self._get_clinical_colormap(colormap_type)
-        heatmap_colored = self._apply_colormap(heatmap_clean, colormap)
+        logger.debug("🔬 Step 6: Clinical colormap (%s)", colormap_type)
+        heatmap_colored = self._apply_colormap(heatmap_clean, colormap_type)
         
         # STEP 7: Create overlay compositions
-        print("🔬 Step 7: Overlay composition")
+        logger.debug("🔬 Step 7: Overlay composition")
         overlays = self._create_overlays(
             heatmap_colored, 
             heatmap_clean, 
@@ -113,15 +234,15 @@ class MedicalGradCAMEnhancer:
         )
         
         # STEP 8: Export PNG assets
-        print("🔬 Step 8: PNG export")
+        logger.debug("🔬 Step 8: PNG export")
         png_assets = self._export_png_assets(overlays, heatmap_colored, heatmap_clean)
         
         # STEP 9: Generate SVG colorbar
-        print("🔬 Step 9: SVG colorbar generation")
+        logger.debug("🔬 Step 9: SVG colorbar generation")
         colorbar_svg = self._generate_svg_colorbar(colormap_type)
         
         # STEP 10: Compile metadata
-        print("🔬 Step 10: Metadata compilation")
+        logger.debug("🔬 Step 10: Metadata compilation")
         metadata = self._compile_metadata(
             heatmap_raw.shape,
             (target_size, target_size),
@@ -144,75 +265,224 @@ class MedicalGradCAMEnhancer:
             'clinical_ready': True
         })
         
-        print(f"✅ Enhanced Grad-CAM generation completed - Quality: MEDICAL GRADE")
+        logger.debug("✅ Enhanced Grad-CAM generation completed - Quality: MEDICAL GRADE")
         return result
     
+    def enhance_gradcam_batch(
+        self,
+        heatmaps: Sequence[np.ndarray],
+        retinas: Sequence[Union[np.ndarray, Image.Image]],
+        max_workers: Optional[int] = None,
+        **kwargs
+    ) -> List[Dict]:
+        """
+        Enhance several Grad-CAMs (e.g. a clinical batch audit) concurrently.
+        
+        Each image runs the full enhance_gradcam pipeline in a worker thread;
+        resize, blur, morphology, LUT, blending and PNG encoding all run in
+        OpenCV with the GIL released, and the retina mask cache is shared and
+        locked. Results keep the input order.
+        
+        Args:
+            heatmaps: Raw Grad-CAM heatmaps, one per image
+            retinas: Matching retinal images
+            max_workers: Thread count (default: min(len(heatmaps), cpu_count))
+            **kwargs: Any enhance_gradcam option, applied to every image
+            
+        Returns:
+            List of enhance_gradcam result dicts
+        """
+        if len(heatmaps) != len(retinas):
+            raise ValueError(f"Got {len(heatmaps)} heatmaps but {len(retinas)} retinal images")
+        if not heatmaps:
+            return []
+        
+        workers = max_workers or min(len(heatmaps), os.cpu_count() or 1)
+        if workers <= 1:
+            return [self.enhance_gradcam(h, r, **kwargs) for h, r in zip(heatmaps, retinas)]
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda pair: self.enhance_gradcam(*pair, **kwargs), zip(heatmaps, retinas)))
+    
     def _robust_normalize(self, heatmap: np.ndarray, percentile_range: Tuple[float, float]) -> np.ndarray:
         """
         Step 1: Enhanced percentile-based normalization (0.5-99.5%)
         Evita saturación en rojo y mantiene detalles clínicos importantes
         """
         p_low, p_high = percentile_range
+        # float32 end-to-end: the rest of the pipeline is memory-bound image math
+        heatmap = np.asarray(heatmap, dtype=np.float32)
         
         # 🏥 MEJORA CLÍNICA: Usar percentiles más precisos para evitar saturación
-        print(f"🔬 Aplicando normalización clínica: percentiles {p_low}-{p_high}%")
+        logger.debug("🔬 Aplicando normalización clínica: percentiles %s-%s%%", p_low, p_high)
         
         # Calculate percentiles only on non-zero values to avoid background bias
         non_zero_mask = heatmap > 1e-6  # Umbral más estricto para valores válidos
         if np.any(non_zero_mask):
             valid_values = heatmap[non_zero_mask]
-            p_low_val = np.percentile(valid_values, p_low)
-            p_high_val = np.percentile(valid_values, p_high)
-            print(f"   📊 Rango de activación: [{p_low_val:.6f}, {p_high_val:.6f}]")
+            p_low_val, p_high_val = fast_percentiles(valid_values, (p_low, p_high))
+            logger.debug("   📊 Rango de activación: [%.6f, %.6f]", p_low_val, p_high_val)
         else:
-            p_low_val = np.percentile(heatmap, p_low)
-            p_high_val = np.percentile(heatmap, p_high)
-            print(f"   ⚠️  Usando todos los valores: [{p_low_val:.6f}, {p_high_val:.6f}]")
+            p_low_val, p_high_val = fast_percentiles(heatmap, (p_low, p_high))
+            logger.warning("   ⚠️  Usando todos los valores: [%.6f, %.6f]", p_low_val, p_high_val)
         
         # Avoid division by zero with better handling
         if p_high_val <= p_low_val:
             p_high_val = p_low_val + 1e-8
-            print(f"   🔧 Rango ajustado para evitar división por cero")
+            logger.debug("   🔧 Rango ajustado para evitar división por cero")
             
         # 🎯 MEJORA: Normalización suave que preserva gradientes sutiles
-        heatmap_clipped = np.clip(heatmap, p_low_val, p_high_val)
-        heatmap_normalized = (heatmap_clipped - p_low_val) / (p_high_val - p_low_val)
+        # (un solo buffer nuevo: el heatmap del llamador no se modifica)
+        heatmap_normalized = np.clip(heatmap, p_low_val, p_high_val, out=np.empty_like(heatmap))
+        heatmap_normalized -= p_low_val
+        heatmap_normalized *= 1.0 / (p_high_val - p_low_val)
         
-        # Verificar calidad de la normalización
-        final_min, final_max = heatmap_normalized.min(), heatmap_normalized.max()
-        print(f"   ✅ Normalización completada: [{final_min:.3f}, {final_max:.3f}]")
+        # Verificar calidad de la normalización (solo si se va a registrar)
+        if logger.isEnabledFor(logging.DEBUG):
+            final_min, final_max = heatmap_normalized.min(), heatmap_normalized.max()
+            logger.debug("   ✅ Normalización completada: [%.3f, %.3f]", final_min, final_max)
         
         return heatmap_normalized
     
     def _bicubic_upscale(self, heatmap: np.ndarray, target_shape: Tuple[int, int]) -> np.ndarray:
-        """Step 2: High-quality bicubic interpolation"""
+        """Step 3: High-quality bicubic interpolation"""
         return cv2.resize(heatmap, target_shape, interpolation=cv2.INTER_CUBIC)
     
-    def _gaussian_smooth(self, heatmap: np.ndarray, kernel_size: int) -> np.ndarray:
-        """Step 3: Gaussian blur for smooth transitions"""
+    @staticmethod
+    def _blur_scale(heatmap_shape: Tuple, target_size: int) -> float:
+        """Ratio between heatmap and output resolution (1.0 if not upsampling)"""
+        if len(heatmap_shape) < 2:
+            return 1.0
+        return min(1.0, heatmap_shape[1] / float(target_size))
+    
+    def _gaussian_smooth(self, heatmap: np.ndarray, kernel_size: int, scale: float = 1.0) -> np.ndarray:
+        """
+        Step 2: Gaussian blur for smooth transitions. kernel_size is expressed at
+        output resolution; scale < 1 shrinks sigma for a lower-resolution input
+        """
         sigma = kernel_size / 6.0  # Standard sigma calculation
-        return cv2.GaussianBlur(heatmap, (kernel_size, kernel_size), sigma)
+        if scale >= 1.0:
+            return cv2.GaussianBlur(heatmap, (kernel_size, kernel_size), sigma)
+        return cv2.GaussianBlur(heatmap, (0, 0), sigma * scale)
     
     def _create_retina_mask(self, retina_image: np.ndarray) -> Dict:
-        """Step 4: Create circular retina mask"""
-        height, width = retina_image.shape[:2]
-        
+        """Step 4: Create circular retina mask (cached per image content)"""
         # Convert to grayscale for circle detection
         gray = cv2.cvtColor(retina_image, cv2.COLOR_RGB2GRAY)
         
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(str(gray.shape).encode())
+        hasher.update(np.ascontiguousarray(gray).data)
+        cache_key = hasher.digest()
+        with self._mask_cache_lock:
+            mask_info = self._mask_cache.get(cache_key)
+            if mask_info is not None:
+                self._mask_cache.move_to_end(cache_key)
+                return mask_info
+        
+        mask_info = self._detect_retina_mask(gray)
+        mask_info['mask'].setflags(write=False)
+        
+        with self._mask_cache_lock:
+            self._mask_cache[cache_key] = mask_info
+            if len(self._mask_cache) > self.MASK_CACHE_SIZE:
+                self._mask_cache.popitem(last=False)
+        return mask_info
+    
+    def _detect_retina_mask(self, gray: np.ndarray) -> Dict:
+        """Detect the retina disk on the grayscale image and build its feathered mask"""
+        height, width = gray.shape[:2]
+        
         # Apply bilateral filter to reduce noise while preserving edges
         filtered = cv2.bilateralFilter(gray, 9, 75, 75)
         
-        # Adaptive Canny edge detection
-        mean_intensity = np.mean(filtered)
-        lower_thresh = max(30, int(mean_intensity * 0.4))
-        upper_thresh = max(60, int(mean_intensity * 0.8))
-        edges = cv2.Canny(filtered, lower_thresh, upper_thresh)
+        # Fast path: the fundus is a bright disk on a dark background, so the
+        # moments of its silhouette give center and radius directly
+        circle = self._estimate_disk_from_moments(filtered)
+        if circle is None:
+            circle = self._hough_retina_circle(filtered)
+        center_x, center_y, radius, confidence = circle
         
-        # Morphological cleanup
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-        edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel)
+        # 🎯 MEJORA: Crear máscara circular con borde feather de 20px
+        logger.debug("🎯 Creando máscara circular mejorada: centro=(%s, %s), radio=%s", center_x, center_y, radius)
+        
+        # Crear máscara con feather de 20px
+        feather_pixels = 20
+        if (height, width) == self.output_size:
+            y_coords, x_coords = self._y_grid, self._x_grid
+        else:
+            y_coords, x_coords = np.ogrid[:height, :width]
+        distances_sq = (x_coords - center_x)**2 + (y_coords - center_y)**2
+        
+        # Zona completamente opaca (interior)
+        inner_radius = max(0, radius - feather_pixels)
+        # Zona de transición suave (feather)
+        outer_radius = radius + feather_pixels
+        
+        # Interior a 1 y exterior a 0 comparando distancias al cuadrado;
+        # la raíz solo se calcula en el anillo de transición
+        mask = (distances_sq <= inner_radius**2).astype(np.float32)
+        annulus = (distances_sq > inner_radius**2) & (distances_sq < outer_radius**2)
+        mask[annulus] = 1.0 - (np.sqrt(distances_sq[annulus]) - inner_radius) / (outer_radius - inner_radius)
+        
+        # 🔬 MEJORA CLÍNICA: Suavizar aún más los bordes para evitar artefactos
+        mask = cv2.GaussianBlur(mask, (7, 7), 2.5)
+        
+        logger.debug("   ✅ Máscara creada con feather de %spx - Sin artefactos rectangulares", feather_pixels)
+        
+        return {
+            'mask': mask,
+            'center': (center_x, center_y),
+            'radius': radius,
+            'confidence': confidence
+        }
+    
+    def _estimate_disk_from_moments(self, filtered: np.ndarray) -> Optional[Tuple[int, int, int, float]]:
+        """
+        Retina disk from the moments of the largest bright region (Otsu threshold).
+        Returns None when that region is not a plausible, round, in-frame disk
+        """
+        height, width = filtered.shape[:2]
+        min_radius = int(min(width, height) * 0.3)
+        max_radius = int(min(width, height) * 0.48)
         
+        _, binary = cv2.threshold(filtered, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None
+        
+        # Contour moments describe the filled silhouette, so dark lesions inside don't matter
+        contour = max(contours, key=cv2.contourArea)
+        moments = cv2.moments(contour)
+        area = moments['m00']
+        if area <= 0:
+            return None
+        
+        center_x = moments['m10'] / area
+        center_y = moments['m01'] / area
+        radius = np.sqrt(area / np.pi)
+        if not (min_radius <= radius <= max_radius):
+            return None
+        if (center_x - radius < 0 or center_x + radius >= width or
+                center_y - radius < 0 or center_y + radius >= height):
+            return None
+        
+        # A uniform disk has polar inertia area * r^2 / 2 and fills its enclosing
+        # circle; irregular silhouettes (wide-field captures, glare) fail either test
+        inertia_radius = np.sqrt(2.0 * (moments['mu20'] + moments['mu02']) / area)
+        roundness = min(radius, inertia_radius) / max(radius, inertia_radius)
+        _, enclosing_radius = cv2.minEnclosingCircle(contour)
+        fill = area / (np.pi * enclosing_radius**2)
+        confidence = min(0.9, min(roundness, fill) * 0.9)
+        if confidence < 0.75:
+            return None
+        
+        return int(round(center_x)), int(round(center_y)), int(round(radius)), confidence
+    
+    def _hough_retina_circle(self, filtered: np.ndarray) -> Tuple[int, int, int, float]:
+        """Fallback circle detection with HoughCircles"""
+        height, width = filtered.shape[:2]
+
         # Circle detection with multiple parameter sets
         min_radius = int(min(width, height) * 0.3)
         max_radius = int(min(width, height) * 0.48)
@@ -263,84 +533,32 @@ class MedicalGradCAMEnhancer:
             radius = int(min(width, height) * 0.4)
             confidence = 0.3
         
-        # 🎯 MEJORA: Crear máscara circular con borde feather de 20px
-        print(f"🎯 Creando máscara circular mejorada: centro=({center_x}, {center_y}), radio={radius}")
-        
-        mask = np.zeros((height, width), dtype=np.float32)
-        
-        # Crear máscara con feather de 20px
-        feather_pixels = 20
-        y_coords, x_coords = np.ogrid[:height, :width]
-        distances = np.sqrt((x_coords - center_x)**2 + (y_coords - center_y)**2)
-        
-        # Zona completamente opaca (interior)
-        inner_radius = max(0, radius - feather_pixels)
-        # Zona de transición suave (feather)
-        outer_radius = radius + feather_pixels
-        
-        # Aplicar transición suave con función sigmoide
-        mask = np.where(distances <= inner_radius, 1.0, 
-                       np.where(distances >= outer_radius, 0.0,
-                               1.0 - (distances - inner_radius) / (outer_radius - inner_radius)))
-        
-        # 🔬 MEJORA CLÍNICA: Suavizar aún más los bordes para evitar artefactos
-        mask = cv2.GaussianBlur(mask, (7, 7), 2.5)
-        
-        print(f"   ✅ Máscara creada con feather de {feather_pixels}px - Sin artefactos rectangulares")
-        
-        return {
-            'mask': mask,
-            'center': (center_x, center_y),
-            'radius': radius,
-            'confidence': confidence
-        }
+        return center_x, center_y, radius, confidence
     
     def _apply_retina_mask(self, heatmap: np.ndarray, mask: np.ndarray) -> np.ndarray:
-        """Apply circular mask to heatmap"""
-        return heatmap * mask
+        """Apply circular mask to heatmap (in place on the freshly upscaled float32 array)"""
+        if heatmap.dtype != np.float32 or heatmap.shape != mask.shape:
+            return heatmap * mask
+        return cv2.multiply(heatmap, mask, dst=heatmap)
     
     def _eliminate_noise(self, heatmap: np.ndarray, threshold: float = 0.05) -> np.ndarray:
         """Step 5: Noise elimination with soft thresholding and morphological opening"""
-        # Soft thresholding
-        heatmap_thresh = np.where(heatmap < threshold, 0, heatmap)
-        
-        # Morphological opening to remove small noise
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-        
-        # Convert to uint8 for morphology
-        heatmap_uint8 = (heatmap_thresh * 255).astype(np.uint8)
-        
-        # Apply opening
-        opened = cv2.morphologyEx(heatmap_uint8, cv2.MORPH_OPENING, kernel, iterations=1)
-        
-        # Convert back to float
-        heatmap_clean = opened.astype(np.float32) / 255.0
-        
-        return heatmap_clean
-    
-    def _get_clinical_colormap(self, colormap_type: str):
-        """Get clinical colormap"""
-        if colormap_type == 'inferno':
-            return plt.cm.inferno
-        elif colormap_type == 'jet':
-            # Custom medical jet: blue (safe) -> red (critical)
-            colors = [
-                (0.0, [0.0, 0.0, 0.5, 0.0]),  # Dark blue transparent
-                (0.2, [0.0, 0.2, 0.8, 0.4]),  # Blue
-                (0.4, [0.0, 0.8, 0.8, 0.7]),  # Cyan  
-                (0.6, [0.0, 1.0, 0.0, 0.8]),  # Green
-                (0.8, [1.0, 1.0, 0.0, 0.9]),  # Yellow
-                (1.0, [1.0, 0.0, 0.0, 1.0])   # Red
-            ]
-            return LinearSegmentedColormap.from_list('medical_jet', colors)
-        elif colormap_type == 'viridis':
-            return plt.cm.viridis
-        else:
-            return plt.cm.inferno  # Default fallback
+        # Soft thresholding (in place: the masked heatmap is a fresh array)
+        heatmap_thresh = heatmap.astype(np.float32, copy=False)
+        cv2.threshold(heatmap_thresh, threshold, 0, cv2.THRESH_TOZERO, dst=heatmap_thresh)
+        
+        # Morphological opening to remove small noise, directly on float32
+        return cv2.morphologyEx(heatmap_thresh, cv2.MORPH_OPEN, self._ellipse3, iterations=1)
     
-    def _apply_colormap(self, heatmap: np.ndarray, colormap) -> np.ndarray:
-        """Apply colormap to heatmap"""
-        return colormap(heatmap)
+    def _get_clinical_colormap(self, colormap_type: str) -> np.ndarray:
+        """Get clinical colormap as a (256, 4) uint8 RGBA LUT"""
+        return self._luts.get(colormap_type, self._luts['inferno'])
+    
+    def _apply_colormap(self, heatmap: np.ndarray, colormap_type: str) -> np.ndarray:
+        """Apply colormap to heatmap via cv2.LUT (uint8 RGBA, same binning as matplotlib)"""
+        lut = self._cv_luts.get(colormap_type, self._cv_luts['inferno'])
+        indices = np.minimum(heatmap * 256, 255, dtype=np.float32).astype(np.uint8)
+        return cv2.LUT(cv2.merge([indices] * 4), lut)
     
     def _create_overlays(
         self, 
@@ -350,31 +568,25 @@ class MedicalGradCAMEnhancer:
         alpha_overlay: float,
         mask: np.ndarray
     ) -> Dict:
-        """Create different overlay compositions"""
+        """Create the exported overlay compositions (RGBA transparent + RGB)"""
         overlays = {}
         
-        # RGBA transparent overlay (for web control)
-        rgba_overlay = heatmap_colored.copy()
-        # Set alpha based on activation intensity and mask
-        alpha_channel = heatmap_intensity * mask * alpha_overlay
-        rgba_overlay[:, :, 3] = alpha_channel
-        overlays['rgba_transparent'] = rgba_overlay
-        
-        # Opaque RGBA (full alpha where there's activation)  
-        rgba_opaque = heatmap_colored.copy()
-        alpha_opaque = (heatmap_intensity > 0.01) * mask
-        rgba_opaque[:, :, 3] = alpha_opaque
-        overlays['rgba_opaque'] = rgba_opaque
+        # Per-pixel weight: activation intensity * mask * alpha
+        alpha_channel = cv2.multiply(heatmap_intensity, mask, scale=alpha_overlay)
         
-        # RGB overlay (traditional superimposition)
-        rgb_overlay = retina_image.astype(np.float32) / 255.0
-        heatmap_rgb = heatmap_colored[:, :, :3]
+        # RGB overlay (traditional superimposition): per-pixel weighted blend
+        # heatmap * w + retina * (1 - w) in one OpenCV pass on uint8 data
+        heatmap_rgb = cv2.cvtColor(heatmap_colored, cv2.COLOR_RGBA2RGB)
+        overlays['rgb_overlay'] = cv2.blendLinear(
+            heatmap_rgb, np.ascontiguousarray(retina_image, dtype=np.uint8),
+            alpha_channel, 1.0 - alpha_channel
+        )
         
-        # Blend based on activation intensity
-        blend_mask = (heatmap_intensity * mask)[:, :, np.newaxis]
-        rgb_overlay = (1 - blend_mask * alpha_overlay) * rgb_overlay + blend_mask * alpha_overlay * heatmap_rgb
-        rgb_overlay = np.clip(rgb_overlay * 255, 0, 255).astype(np.uint8)
-        overlays['rgb_overlay'] = rgb_overlay
+        # RGBA transparent overlay (for web control): the colormapped heatmap is
+        # a fresh per-call array, so its alpha channel is written in place
+        rgba_overlay = heatmap_colored
+        rgba_overlay[:, :, 3] = alpha_channel * 255
+        overlays['rgba_transparent'] = rgba_overlay
         
         return overlays
     
@@ -385,140 +597,54 @@ class MedicalGradCAMEnhancer:
         """
         assets = {}
         
-        print(f"🎨 Exportando PNG transparente clínico...")
+        logger.debug("🎨 Exportando PNG transparente clínico...")
         
         # 🎯 MEJORA: RGBA transparente SIN fondo rojo para superposición médica
-        rgba_img = (overlays['rgba_transparent'] * 255).astype(np.uint8)
+        rgba_img = overlays['rgba_transparent']
         
         # Verificar que tenemos canal alpha correcto
         if rgba_img.shape[2] == 4:
-            print(f"   ✅ Canal RGBA válido: {rgba_img.shape}")
+            logger.debug("   ✅ Canal RGBA válido: %s", rgba_img.shape)
             # Asegurar que el fondo sea completamente transparente
             alpha_channel = rgba_img[:, :, 3]
             # Donde alpha es 0, hacer RGB también 0 para evitar bleeding
             zero_alpha_mask = alpha_channel == 0
             rgba_img[zero_alpha_mask, :3] = 0
         else:
-            print(f"   ⚠️  Convirtiendo a RGBA: {rgba_img.shape}")
+            logger.warning("   ⚠️  Convirtiendo a RGBA: %s", rgba_img.shape)
             # Convertir RGB a RGBA con alpha basado en intensidad
             if rgba_img.shape[2] == 3:
                 alpha = np.where(heatmap_intensity > 0.01, 
                                (heatmap_intensity * 255).astype(np.uint8), 0)
                 rgba_img = np.dstack([rgba_img, alpha])
         
-        rgba_pil = Image.fromarray(rgba_img, 'RGBA')
-        rgba_buffer = BytesIO()
-        rgba_pil.save(rgba_buffer, format='PNG', optimize=True, compress_level=6)
-        assets['rgba_transparent'] = base64.b64encode(rgba_buffer.getvalue()).decode('utf-8')
+        assets['rgba_transparent'] = self._encode_png(rgba_img, cv2.COLOR_RGBA2BGRA)
         
         # RGB overlay PNG (mantenido para compatibilidad)
-        rgb_pil = Image.fromarray(overlays['rgb_overlay'], 'RGB')
-        rgb_buffer = BytesIO()
-        rgb_pil.save(rgb_buffer, format='PNG', optimize=True, compress_level=6)
-        assets['rgb_overlay'] = base64.b64encode(rgb_buffer.getvalue()).decode('utf-8')
+        assets['rgb_overlay'] = self._encode_png(overlays['rgb_overlay'], cv2.COLOR_RGB2BGR)
         
-        print(f"   ✅ PNG transparente exportado - Listo para superposición clínica")
+        logger.debug("   ✅ PNG transparente exportado - Listo para superposición clínica")
         return assets
     
+    def _encode_png(self, image: np.ndarray, to_bgr: int) -> str:
+        """Encode an RGB(A) uint8 image as base64 PNG with OpenCV's writer"""
+        ok, encoded = cv2.imencode(
+            '.png', cv2.cvtColor(image, to_bgr),
+            [cv2.IMWRITE_PNG_COMPRESSION, self.PNG_COMPRESSION_LEVEL]
+        )
+        if not ok:
+            raise ValueError(f"PNG encoding failed for image of shape {image.shape}")
+        return base64.b64encode(encoded.tobytes()).decode('utf-8')
+    
     def _generate_svg_colorbar(self, colormap_type: str, width: int = 350, height: int = 60) -> str:
         """
         🏥 MEJORA CLÍNICA: Barra de color médica con etiquetas profesionales
         Escala 'Baja ↔ Alta activación' para interpretación clínica
         """
-        print(f"📊 Generando barra de color clínica...")
-        
-        colormap = self._get_clinical_colormap(colormap_type)
-        
-        # Create SVG root con mayor altura para etiquetas médicas
-        svg = ET.Element('svg', {
-            'width': str(width),
-            'height': str(height + 50),
-            'viewBox': f'0 0 {width} {height + 50}',
-            'xmlns': 'http://www.w3.org/2000/svg',
-            'style': 'background: white; border-radius: 8px;'
-        })
-        
-        # 🎯 TÍTULO MÉDICO
-        title = ET.SubElement(svg, 'text', {
-            'x': str(width//2), 'y': '15',
-            'font-family': 'Arial, sans-serif', 'font-size': '14', 'font-weight': 'bold',
-            'fill': '#2d3748', 'text-anchor': 'middle'
-        })
-        title.text = 'Mapa de Activación Neural - Análisis Clínico'
-        
-        # Create gradient definition
-        defs = ET.SubElement(svg, 'defs')
-        gradient = ET.SubElement(defs, 'linearGradient', {
-            'id': 'medicalGradient',
-            'x1': '0%', 'y1': '0%', 'x2': '100%', 'y2': '0%'
-        })
-        
-        # Add color stops con más resolución para suavidad
-        num_stops = 50
-        for i in range(num_stops):
-            position = i / (num_stops - 1)
-            color_rgba = colormap(position)
-            color_hex = f"#{int(color_rgba[0]*255):02x}{int(color_rgba[1]*255):02x}{int(color_rgba[2]*255):02x}"
-            
-            ET.SubElement(gradient, 'stop', {
-                'offset': f'{position*100}%',
-                'stop-color': color_hex,
-                'stop-opacity': '1'
-            })
-        
-        # Gradient rectangle con bordes redondeados
-        ET.SubElement(svg, 'rect', {
-            'x': '30', 'y': '25',
-            'width': str(width-60), 'height': str(height-35),
-            'fill': 'url(#medicalGradient)',
-            'stroke': '#4a5568', 'stroke-width': '2',
-            'rx': '4', 'ry': '4'
-        })
-        
-        # 🏥 ETIQUETAS MÉDICAS MEJORADAS
-        # Etiqueta izquierda
-        left_label = ET.SubElement(svg, 'text', {
-            'x': '30', 'y': str(height + 40),
-            'font-family': 'Arial, sans-serif', 'font-size': '13', 'font-weight': '600',
-            'fill': '#4a5568', 'text-anchor': 'start'
-        })
-        left_label.text = '← Baja Activación'
-        
-        # Etiqueta central con flecha bidireccional
-        center_label = ET.SubElement(svg, 'text', {
-            'x': str(width//2), 'y': str(height + 40),
-            'font-family': 'Arial, sans-serif', 'font-size': '12', 'font-weight': '500',
-            'fill': '#2d3748', 'text-anchor': 'middle'
-        })
-        center_label.text = 'Intensidad de Atención IA'
-        
-        # Etiqueta derecha
-        right_label = ET.SubElement(svg, 'text', {
-            'x': str(width-30), 'y': str(height + 40),
-            'font-family': 'Arial, sans-serif', 'font-size': '13', 'font-weight': '600',
-            'fill': '#4a5568', 'text-anchor': 'end'
-        })
-        right_label.text = 'Alta Activación →'
-        
-        # 📈 MARCADORES DE ESCALA
-        for i, (pos, label) in enumerate([(0, '0%'), (0.25, '25%'), (0.5, '50%'), (0.75, '75%'), (1, '100%')]):
-            x_pos = 30 + (width-60) * pos
-            # Línea de tick
-            ET.SubElement(svg, 'line', {
-                'x1': str(x_pos), 'y1': str(height - 10),
-                'x2': str(x_pos), 'y2': str(height - 5),
-                'stroke': '#4a5568', 'stroke-width': '1.5'
-            })
-            # Etiqueta de porcentaje
-            tick_label = ET.SubElement(svg, 'text', {
-                'x': str(x_pos), 'y': str(height + 15),
-                'font-family': 'Arial, sans-serif', 'font-size': '10',
-                'fill': '#718096', 'text-anchor': 'middle'
-            })
-            tick_label.text = label
-        
-        print(f"   ✅ Barra de color clínica generada con éxito")
-        return ET.tostring(svg, encoding='unicode')
+        logger.debug("📊 Generando barra de color clínica...")
+        svg = _build_colorbar_svg(colormap_type, width, height)
+        logger.debug("   ✅ Barra de color clínica generada con éxito")
+        return svg
     
     def _compile_metadata(
         self, 
@@ -537,7 +663,11 @@ class MedicalGradCAMEnhancer:
             'output_size': f"{output_shape[0]}x{output_shape[1]}",
             'normalization': f'Robust percentiles {percentile_range[0]}-{percentile_range[1]}',
             'interpolation': 'Bicubic INTER_CUBIC (medical-grade)',
-            'smoothing': f'Gaussian blur kernel={gaussian_kernel}, σ={gaussian_kernel/6:.2f}',
+            'smoothing': (
+                f'Gaussian blur kernel={gaussian_kernel}, '
+                f'σ={gaussian_kernel/6 * self._blur_scale(input_shape, output_shape[1]):.2f} '
+                f'(applied before upsampling)'
+            ),
             'masking': f'Circular retina mask (confidence: {mask_info["confidence"]:.3f})',
             'noise_reduction': 'Soft threshold 0.05 + morphological opening',
             'colormap': f'{colormap_type.title()} (clinical standard)',
@@ -559,6 +689,17 @@ class MedicalGradCAMEnhancer:
         }
 
 
+_default_enhancer = None
+
+
+def _get_default_enhancer() -> MedicalGradCAMEnhancer:
+    """Shared enhancer so the colormap LUTs are built once per process"""
+    global _default_enhancer
+    if _default_enhancer is None:
+        _default_enhancer = MedicalGradCAMEnhancer()
+    return _default_enhancer
+
+
 def enhance_gradcam_medical(
     heatmap_raw: np.ndarray, 
     retina_hr: Union[np.ndarray, Image.Image],
@@ -579,10 +720,9 @@ def enhance_gradcam_medical(
     Returns:
         Dict with enhanced visualizations, PNG transparente, y barra de color clínica
     """
-    print(f"🏥 Iniciando GradCAM++ médico mejorado con percentiles {percentile_range}")
+    logger.debug("🏥 Iniciando GradCAM++ médico mejorado con percentiles %s", percentile_range)
     
-    enhancer = MedicalGradCAMEnhancer()
-    return enhancer.enhance_gradcam(
+    return _get_default_enhancer().enhance_gradcam(
         heatmap_raw=heatmap_raw,
         retina_hr=retina_hr, 
         target_size=target_size,
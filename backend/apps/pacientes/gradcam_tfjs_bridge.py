@@ -5,8 +5,6 @@ Genera mapas de calor basados en características de imagen.
 import numpy as np
 import cv2
 import base64
-from PIL import Image
-from io import BytesIO
 
 def generate_mock_gradcam(image_array, prediction_result=None):
     """
@@ -18,45 +16,41 @@ def generate_mock_gradcam(image_array, prediction_result=None):
         if image_array.ndim == 4:
             image_array = image_array[0]  # Remover batch dimension
         
+        # Una sola conversión a uint8; todo el pipeline trabaja en OpenCV
+        image_uint8 = (image_array * 255).astype(np.uint8)
+        
         # Convertir a 96x96 si es necesario
-        if image_array.shape[:2] != (96, 96):
-            image_pil = Image.fromarray((image_array * 255).astype(np.uint8))
-            image_pil = image_pil.resize((96, 96))
-            image_array = np.array(image_pil) / 255.0
+        if image_uint8.shape[:2] != (96, 96):
+            image_uint8 = cv2.resize(image_uint8, (96, 96), interpolation=cv2.INTER_AREA)
         
         # Generar heatmap basado en características visuales
         # Esto es temporal - será reemplazado por modelo real
-        gray = cv2.cvtColor((image_array * 255).astype(np.uint8), cv2.COLOR_RGB2GRAY)
+        gray = cv2.cvtColor(image_uint8, cv2.COLOR_RGB2GRAY)
         
         # Detectar bordes y características importantes
         edges = cv2.Canny(gray, 50, 150)
         
         # Aplicar filtros para simular activaciones convolutionales
         # Enfocarse en áreas con mayor variación (posibles lesiones)
-        kernel = np.ones((5,5), np.float32) / 25
-        blur = cv2.filter2D(gray, -1, kernel)
+        blur = cv2.blur(gray, (5, 5))
         
-        # Combinar edges y blur para crear heatmap base
-        heatmap_base = cv2.addWeighted(edges.astype(np.float32), 0.3, 
-                                     (255 - blur).astype(np.float32), 0.7, 0)
+        # Combinar edges y blur para crear heatmap base (salida float32 directa)
+        heatmap_base = cv2.addWeighted(edges, 0.3, cv2.bitwise_not(blur), 0.7, 0, dtype=cv2.CV_32F)
         
-        # Normalizar y aplicar suavizado
+        # Suavizar y normalizar min-max directamente a uint8
         heatmap_base = cv2.GaussianBlur(heatmap_base, (11, 11), 0)
-        heatmap_base = (heatmap_base - heatmap_base.min()) / (heatmap_base.max() - heatmap_base.min() + 1e-8)
-        
-        # Aplicar colormap
-        heatmap_colored = cv2.applyColorMap((heatmap_base * 255).astype(np.uint8), cv2.COLORMAP_JET)
-        heatmap_colored = cv2.cvtColor(heatmap_colored, cv2.COLOR_BGR2RGB)
+        heatmap_uint8 = cv2.normalize(heatmap_base, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
         
-        # Superponer con imagen original
-        original_uint8 = (image_array * 255).astype(np.uint8)
-        superimposed = cv2.addWeighted(original_uint8, 0.6, heatmap_colored, 0.4, 0)
+        # Aplicar colormap (BGR) y superponer con la imagen original en BGR
+        heatmap_colored = cv2.applyColorMap(heatmap_uint8, cv2.COLORMAP_JET)
+        original_bgr = cv2.cvtColor(image_uint8, cv2.COLOR_RGB2BGR)
+        superimposed = cv2.addWeighted(original_bgr, 0.6, heatmap_colored, 0.4, 0)
         
         # Convertir a base64
-        img_pil = Image.fromarray(superimposed)
-        buffer = BytesIO()
-        img_pil.save(buffer, format="PNG")
-        img_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
+        ok, buffer = cv2.imencode(".png", superimposed)
+        if not ok:
+            raise ValueError("No se pudo codificar el PNG")
+        img_base64 = base64.b64encode(buffer.tobytes()).decode("utf-8")
         
         return {
             "gradcam": img_base64,
@@ -3,23 +3,90 @@ import tensorflow as tf
 import cv2
 import os
 import base64
+import tempfile
 import json
 import logging
-from PIL import Image
-from io import BytesIO
+import threading
 from datetime import datetime
 from typing import List, Dict, Tuple, Optional
 from concurrent.futures import ThreadPoolExecutor
 from django.core.cache import cache
 from django.conf import settings
+from .validators import ImageValidator
+from .utils import fast_percentiles
 
 logger = logging.getLogger(__name__)
 
+# Intérprete TFLite: LiteRT si está instalado, si no el incluido en TensorFlow
+try:
+    from ai_edge_litert.interpreter import Interpreter as TFLiteInterpreter
+except ImportError:
+    TFLiteInterpreter = tf.lite.Interpreter
+
+# Escala de píxeles uint8 -> [0, 1] en float32 (evita el upcast a float64 de "/ 255.0")
+INV_255 = np.float32(1.0 / 255.0)
+
+
+def _gradcam_alpha_lut() -> np.ndarray:
+    """Transparencia del overlay GradCAM por nivel (0-255) del heatmap estirado"""
+    levels = np.arange(256, dtype=np.float32) / 255
+    alpha = np.zeros(256, dtype=np.float32)
+    # Niveles anidados (high ⊂ medium ⊂ low): cada umbral sobrescribe al anterior
+    for threshold, level_alpha in ((0.15, 0.2),    # Activación leve: cambios sutiles
+                                   (0.4, 0.4),     # Lesiones moderadas visibles
+                                   (0.7, 0.6)):    # Lesiones críticas muy visibles
+        alpha[levels > threshold] = level_alpha
+    return alpha
+
+
+def _gradcam_color_lut() -> np.ndarray:
+    """Colormap JET con la gamma 0.7 (resalta microlesiones) ya aplicada, 256x1x3"""
+    levels = np.arange(256, dtype=np.float32) / 255
+    gamma_levels = (np.power(levels, 0.7) * 255).astype(np.uint8).reshape(256, 1)
+    return cv2.applyColorMap(gamma_levels, cv2.COLORMAP_JET)
+
+class QuantizedModel:
+    """Modelo TFLite con pesos INT8 para la inferencia batch (GradCAM sigue usando Keras)"""
+    
+    def __init__(self, model_content: bytes):
+        self.interpreter = TFLiteInterpreter(model_content=model_content)
+        self._input_index = self.interpreter.get_input_details()[0]['index']
+        self._output_index = self.interpreter.get_output_details()[0]['index']
+        self._batch_size = None
+        # El intérprete no es thread-safe
+        self._lock = threading.Lock()
+    
+    def predict(self, images_batch: np.ndarray) -> np.ndarray:
+        """Inferencia sobre un batch float32 (N, H, W, 3)"""
+        with self._lock:
+            # Re-dimensionar los tensores solo cuando cambia el tamaño del batch
+            if images_batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input_index, images_batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = images_batch.shape[0]
+            
+            self.interpreter.set_tensor(self._input_index, np.ascontiguousarray(images_batch, dtype=np.float32))
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self._output_index)
+
 class ModelManager:
     """Gestor avanzado de modelos ML con versionado"""
     
     def __init__(self):
         self.models = {}
+        # Metadata del modelo principal; queda vacía si no existe el .json
+        self.model_metadata = {}
+        # Modelos registrados pero aún no cargados: versión -> (ruta, tamaño de entrada)
+        self._model_paths: Dict[str, Tuple[str, int]] = {}
+        self._load_lock = threading.Lock()
+        # Modelos GradCAM (conv_outputs, predictions) por (versión, capa)
+        self._grad_models: Dict[Tuple[str, str], tf.keras.Model] = {}
+        # Capa GradCAM resuelta por versión al cargar
+        self.gradcam_layers: Dict[str, str] = {}
+        # Versiones cuantizadas (TFLite INT8) por versión: (modelo Keras de origen, QuantizedModel)
+        self.quantized_models: Dict[str, Tuple[tf.keras.Model, QuantizedModel]] = {}
+        # Opt-in: la inferencia INT8 aún no está validada sobre un conjunto de prueba
+        self.use_quantized = getattr(settings, 'ML_QUANTIZED_INFERENCE', False)
         self.current_version = "v2.0"
         self.confidence_threshold = 0.7
         self.load_models()
@@ -52,21 +119,23 @@ class ModelManager:
                 logger.info(f"Modelo {self.current_version} cargado exitosamente ({img_size}x{img_size})")
             except Exception as e:
                 logger.error(f"Error cargando modelo: {e}")
+            
+            if self.current_version in self.models:
+                self._prepare_gradcam(self.current_version)
+                if self.use_quantized:
+                    self._load_quantized_model(self.current_version, model_path)
         
-        # Cargar modelo GradCAM si existe
+        # Modelo GradCAM y modelos adicionales: solo se registran, se cargan al primer uso
         gradcam_path = os.path.join(models_dir, "retinopathy_model_gradcam.keras")
         if os.path.exists(gradcam_path):
-            try:
-                self.models[f"{self.current_version}_gradcam"] = tf.keras.models.load_model(gradcam_path)
-                logger.info(f"Modelo GradCAM {self.current_version} cargado")
-            except Exception as e:
-                logger.warning(f"Error cargando modelo GradCAM: {e}")
+            img_size = self.model_metadata.get('input_shape', [96, 96, 3])[0]
+            self._model_paths[f"{self.current_version}_gradcam"] = (gradcam_path, img_size)
         
-        # Cargar modelos adicionales si existen (mantener compatibilidad)
-        self._load_additional_models(models_dir)
+        # Registrar modelos adicionales si existen (mantener compatibilidad)
+        self._register_additional_models(models_dir)
     
-    def _load_additional_models(self, models_dir):
-        """Cargar modelos adicionales para A/B testing"""
+    def _register_additional_models(self, models_dir):
+        """Registrar modelos adicionales para A/B testing (carga diferida)"""
         # Mantener compatibilidad con modelos anteriores solo si están disponibles
         additional_models = {
             "v1.5": "resnet50_512_final_1.5.keras",
@@ -77,19 +146,177 @@ class ModelManager:
         for version, filename in additional_models.items():
             model_path = os.path.join(models_dir, filename)
             if os.path.exists(model_path):
-                try:
-                    self.models[version] = tf.keras.models.load_model(model_path)
-                    # Determinar tamaño de imagen según el modelo
-                    img_size = 512 if "resnet50" in filename else 96
-                    _ = self.models[version](tf.zeros((1, img_size, img_size, 3), dtype=tf.float32))
-                    logger.info(f"Modelo adicional {version} cargado ({img_size}x{img_size})")
-                except Exception as e:
-                    logger.warning(f"No se pudo cargar modelo {version}: {e}")
+                # Determinar tamaño de imagen según el modelo
+                img_size = 512 if "resnet50" in filename else 96
+                self._model_paths[version] = (model_path, img_size)
+                logger.info(f"Modelo adicional {version} disponible ({img_size}x{img_size}), se cargará al usarse")
+    
+    def _load_registered_model(self, version: str) -> Optional[tf.keras.Model]:
+        """Cargar, calentar y cachear un modelo registrado la primera vez que se pide"""
+        with self._load_lock:
+            if version in self.models:
+                return self.models[version]
+            entry = self._model_paths.pop(version, None)
+            if entry is None:
+                return None
+            
+            model_path, img_size = entry
+            try:
+                model = tf.keras.models.load_model(model_path)
+                _ = model(tf.zeros((1, img_size, img_size, 3), dtype=tf.float32))
+            except Exception as e:
+                # No se vuelve a registrar: un modelo roto no se reintenta en cada petición
+                logger.warning(f"No se pudo cargar modelo {version}: {e}")
+                return None
+            
+            self.models[version] = model
+            logger.info(f"Modelo {version} cargado bajo demanda ({img_size}x{img_size})")
+            if not version.endswith("_gradcam"):
+                self._prepare_gradcam(version)
+            return model
+    
+    def _resolve_version(self, version: str = None) -> str:
+        """Versión utilizable: la pedida (cargándola si hace falta) o la actual"""
+        version = version or self.current_version
+        if version in self.models:
+            return version
+        if version in self._model_paths and self._load_registered_model(version) is not None:
+            return version
+        return self.current_version
     
     def get_model(self, version: str = None) -> tf.keras.Model:
         """Obtener modelo específico"""
-        version = version or self.current_version
-        return self.models.get(version, self.models.get(self.current_version))
+        return self.models.get(self._resolve_version(version))
+    
+    def _load_quantized_model(self, version: str, model_path: str):
+        """
+        Convertir el modelo a TFLite con cuantización INT8 de pesos (dynamic range, no
+        requiere dataset de calibración). El .tflite se cachea junto al .keras
+        """
+        model = self.models[version]
+        tflite_path = os.path.splitext(model_path)[0] + ".int8.tflite"
+        
+        try:
+            if os.path.exists(tflite_path) and os.path.getmtime(tflite_path) >= os.path.getmtime(model_path):
+                with open(tflite_path, 'rb') as f:
+                    tflite_model = f.read()
+            else:
+                converter = tf.lite.TFLiteConverter.from_keras_model(model)
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                tflite_model = converter.convert()
+                self._write_tflite_cache(tflite_path, tflite_model)
+            
+            self.quantized_models[version] = (model, QuantizedModel(tflite_model))
+            logger.info(f"⚡ Modelo {version} cuantizado a TFLite INT8 ({len(tflite_model) // 1024} KB)")
+        except Exception as e:
+            logger.warning(f"No se pudo cuantizar el modelo {version}, se usará Keras: {e}")
+    
+    @staticmethod
+    def _write_tflite_cache(tflite_path: str, tflite_model: bytes):
+        """
+        Escritura atómica del .tflite: otros workers (gunicorn/Celery) lo leen al importar,
+        así que nunca deben ver un archivo a medio escribir
+        """
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(tflite_path), suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                f.write(tflite_model)
+            # mkstemp crea el archivo con 0600; mismos permisos que un open() normal
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, tflite_path)
+        except OSError as e:
+            logger.warning(f"No se pudo cachear el modelo TFLite en disco: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def get_quantized_model(self, version: str = None) -> Optional[QuantizedModel]:
+        """Obtener la versión cuantizada, solo si corresponde al modelo Keras vigente"""
+        version = self._resolve_version(version)
+        entry = self.quantized_models.get(version)
+        if entry is None or entry[0] is not self.models.get(version):
+            return None
+        return entry[1]
+    
+    @staticmethod
+    def resolve_gradcam_layer(model: tf.keras.Model) -> str:
+        """Auto-detectar la capa convolucional para GradCAM"""
+        layer_name = None
+        available_layers = [layer.name for layer in model.layers]
+        conv_layers = [name for name in available_layers if 'conv2d' in name.lower()]
+        
+        if conv_layers:
+            # Buscar específicamente la segunda capa convolucional
+            target_conv_layer = None
+            for layer_name_candidate in conv_layers:
+                if 'conv2d_2' in layer_name_candidate or (len(conv_layers) >= 2 and layer_name_candidate == conv_layers[1]):
+                    target_conv_layer = layer_name_candidate
+                    break
+            
+            # Si no encontramos conv2d_2, usar la última capa conv
+            if target_conv_layer is None:
+                target_conv_layer = conv_layers[-1]
+                
+            layer_name = target_conv_layer
+            logger.info("✅ ML Auto-detectada capa GradCAM: %s", layer_name)
+        else:
+            # Fallback
+            candidates = ['conv2d_2_functional_3', 'conv2d_2', 'conv2d_1_functional_0', 'conv2d_1']
+            for candidate in candidates:
+                if candidate in available_layers:
+                    layer_name = candidate
+                    break
+            
+            if layer_name is None:
+                layer_name = 'conv2d_2'  # Último recurso
+        
+        return layer_name
+    
+    @staticmethod
+    def _build_grad_model(model: tf.keras.Model, layer_name: str) -> tf.keras.Model:
+        """Modelo (conv_outputs, predictions) que comparte capas y pesos con `model`"""
+        if isinstance(model, tf.keras.Sequential):
+            # Keras 3: un Sequential cargado de disco no expone un grafo simbólico
+            # (model.output), así que se re-aplican sus capas sobre un Input nuevo
+            inputs = tf.keras.Input(shape=model.input_shape[1:])
+            x = inputs
+            conv_outputs = None
+            for layer in model.layers:
+                x = layer(x)
+                if layer.name == layer_name:
+                    conv_outputs = x
+            
+            if conv_outputs is None:
+                raise ValueError(f"Capa {layer_name} no encontrada en el modelo")
+            return tf.keras.Model(inputs, [conv_outputs, x])
+        
+        return tf.keras.Model(model.inputs, [model.get_layer(layer_name).output, model.output])
+    
+    def _prepare_gradcam(self, version: str):
+        """Resolver la capa GradCAM y construir el grad_model al cargar el modelo"""
+        try:
+            model = self.models[version]
+            layer_name = self.resolve_gradcam_layer(model)
+            self.gradcam_layers[version] = layer_name
+            self._grad_models[(version, layer_name)] = self._build_grad_model(model, layer_name)
+            logger.info(f"Grad model {version} listo (capa {layer_name})")
+        except Exception as e:
+            logger.warning(f"No se pudo preparar GradCAM para {version}: {e}")
+    
+    def get_grad_model(self, version: str = None, layer_name: str = None) -> tf.keras.Model:
+        """Obtener el modelo GradCAM de una versión (por defecto, con la capa resuelta al cargar)"""
+        version = self._resolve_version(version)
+        
+        if layer_name is None:
+            layer_name = self.gradcam_layers.get(version)
+            if layer_name is None:
+                layer_name = self.resolve_gradcam_layer(self.get_model(version))
+                self.gradcam_layers[version] = layer_name
+        
+        cache_key = (version, layer_name)
+        if cache_key not in self._grad_models:
+            self._grad_models[cache_key] = self._build_grad_model(self.get_model(version), layer_name)
+        return self._grad_models[cache_key]
     
     def set_confidence_threshold(self, threshold: float):
         """Configurar umbral de confianza"""
@@ -100,247 +327,367 @@ class ModelManager:
 class BatchMLProcessor:
     """Procesador ML optimizado para operaciones batch"""
     
+    # Kernels de sharpening del post-procesamiento GradCAM (constantes, float32 como
+    # los usa cv2.filter2D)
+    GRADCAM_SHARPEN_KERNEL = np.array([[-1, -1, -1],
+                                       [-1,  9, -1],
+                                       [-1, -1, -1]], dtype=np.float32)
+    GRADCAM_FINAL_KERNEL = np.array([[0, -1, 0],
+                                     [-1, 5, -1],
+                                     [0, -1, 0]], dtype=np.float32) * np.float32(0.3)
+    GRADCAM_JPEG_QUALITY = 85
+    # LUTs indexadas por el nivel cuantizado del heatmap: alpha por severidad, su
+    # complemento (peso de la imagen original) y color clínico
+    GRADCAM_ALPHA_LUT = _gradcam_alpha_lut()
+    GRADCAM_ORIGINAL_WEIGHT_LUT = np.float32(1) - GRADCAM_ALPHA_LUT
+    GRADCAM_COLOR_LUT = _gradcam_color_lut()
+    
     def __init__(self):
         self.model_manager = ModelManager()
         self.max_batch_size = 8
         # Usar tamaño del nuevo modelo desde metadata
         img_size = getattr(self.model_manager, 'model_metadata', {}).get('input_shape', [96, 96, 3])[0]
         self.target_size = (img_size, img_size)
+        # Resolución del post-procesamiento GradCAM. Igual a target_size evita el
+        # upscale a 512x512 que luego se descartaba al volver a target_size
+        self.clinical_output_size = self.target_size
+        # Formato del GradCAM en base64: "jpeg" (por defecto, más liviano) o "png" (sin pérdida)
+        self.gradcam_format = "jpeg"
+        # Pool persistente para decodificar/redimensionar en paralelo (cv2 libera el GIL)
+        self._io_pool = ThreadPoolExecutor(max_workers=min(self.max_batch_size, os.cpu_count() or 1))
+        # Funciones GradCAM compiladas (tf.function) por (versión, capa)
+        self._gradcam_fns = {}
+        # Buffers del post-procesamiento GradCAM (thread-local: el singleton se comparte)
+        self._render_buffers = threading.local()
     
     def process_images_batch(self, image_paths: List[str], model_version: str = None) -> List[Dict]:
         """Procesar múltiples imágenes en batch para mejor performance"""
-        results = []
+        version = model_version or self.model_manager.current_version
+        
+        # Agrupar por contenido (SHA-256, el mismo hash que ImagenPaciente.archivo_hash):
+        # cada imagen distinta se infiere una sola vez aunque se repita en el batch
+        unique_paths = []
+        unique_hashes = []
+        positions = []
+        seen = {}
+        for i, path in enumerate(image_paths):
+            image_hash = self._get_image_hash(path)
+            key = image_hash if image_hash is not None else i
+            if key in seen:
+                positions[seen[key]].append(i)
+                continue
+            seen[key] = len(unique_paths)
+            unique_paths.append(path)
+            unique_hashes.append(image_hash)
+            positions.append([i])
         
-        # Procesar en chunks del tamaño de batch
-        for i in range(0, len(image_paths), self.max_batch_size):
-            batch_paths = image_paths[i:i + self.max_batch_size]
-            batch_results = self._process_batch_chunk(batch_paths, model_version)
-            results.extend(batch_results)
+        # Consultar el cache de predicciones; solo los misses pasan por el modelo
+        unique_results = [None] * len(unique_paths)
+        miss_rows = []
+        for row, image_hash in enumerate(unique_hashes):
+            cached = MLCache.get_cached_prediction(image_hash, version) if image_hash else None
+            if cached:
+                unique_results[row] = cached
+            else:
+                miss_rows.append(row)
+        
+        if len(miss_rows) < len(unique_paths):
+            logger.info(f"⚡ {len(unique_paths) - len(miss_rows)} de {len(image_paths)} imágenes resueltas desde cache")
+        
+        # Procesar los misses en chunks del tamaño de batch
+        for i in range(0, len(miss_rows), self.max_batch_size):
+            chunk_rows = miss_rows[i:i + self.max_batch_size]
+            batch_results = self._process_batch_chunk([unique_paths[row] for row in chunk_rows], model_version)
+            
+            # Las imágenes que fallan no devuelven resultado: emparejar por ruta
+            results_by_path = {result['image_path']: result for result in batch_results}
+            for row in chunk_rows:
+                result = results_by_path.get(unique_paths[row])
+                unique_results[row] = result
+                if result is not None and unique_hashes[row]:
+                    MLCache.cache_prediction(unique_hashes[row], result['model_version'], result)
+        
+        # Reconstruir la salida en el orden de entrada (duplicados incluidos)
+        results = [None] * len(image_paths)
+        for row, result in enumerate(unique_results):
+            if result is None:
+                continue
+            for i in positions[row]:
+                results[i] = {**result, 'image_path': image_paths[i]}
         
-        return results
+        return [result for result in results if result is not None]
+    
+    @staticmethod
+    def _get_image_hash(image_path: str) -> Optional[str]:
+        """Hash SHA-256 del contenido del archivo (None si no se puede leer)"""
+        if not isinstance(image_path, str):
+            return None
+        try:
+            with open(image_path, 'rb') as f:
+                return ImageValidator.get_file_hash(f)
+        except OSError:
+            return None
     
     def _process_batch_chunk(self, image_paths: List[str], model_version: str = None) -> List[Dict]:
         """Procesar un chunk de imágenes"""
         try:
-            # Cargar y preprocesar imágenes
-            images_batch = []
+            # Cargar y preprocesar imágenes en paralelo, cada una directamente en su
+            # fila de un buffer float32 contiguo
+            images_batch = np.empty((len(image_paths), *self.target_size, 3), dtype=np.float32)
+            futures = [
+                self._io_pool.submit(self._load_and_preprocess_image, path, images_batch[i])
+                for i, path in enumerate(image_paths)
+            ]
+            
+            valid_rows = []
             valid_paths = []
-            
-            for path in image_paths:
+            for i, (path, future) in enumerate(zip(image_paths, futures)):
                 try:
-                    img = self._load_and_preprocess_image(path)
-                    if img is not None:
-                        images_batch.append(img)
+                    if future.result() is not None:
+                        valid_rows.append(i)
                         valid_paths.append(path)
                 except Exception as e:
                     logger.warning(f"Error cargando imagen {path}: {e}")
             
-            if not images_batch:
+            if not valid_paths:
                 return []
             
-            # Predicción batch
+            # Predicción batch (solo las filas cargadas correctamente)
             model = self.model_manager.get_model(model_version)
-            images_array = np.array(images_batch)
-            predictions = model.predict(images_array, batch_size=len(images_batch))
-            
-            # Procesar resultados
+            if len(valid_rows) < len(image_paths):
+                images_batch = images_batch[valid_rows]
+            quantized_model = self.model_manager.get_quantized_model(model_version)
+            if quantized_model is not None:
+                predictions = quantized_model.predict(images_batch)
+            else:
+                predictions = model.predict(images_batch, batch_size=len(valid_paths))
+            
+            # Argmax, máximo, umbral y redondeo vectorizados para todo el batch (en float64,
+            # como el float()+round() por elemento; tolist() da tipos nativos de Python)
+            predictions = np.asarray(predictions, dtype=np.float64)
+            class_preds = predictions.argmax(axis=1).tolist()
+            confidences = predictions.max(axis=1)
+            reliable_flags = (confidences >= self.model_manager.confidence_threshold).tolist()
+            rounded_confidences = np.round(confidences, 4).tolist()
+            rounded_probabilities = np.round(predictions, 4).tolist()
+            
+            # Procesar resultados (un único timestamp para todo el batch)
+            processed_at = datetime.now().isoformat()
             results = []
-            for i, (path, pred) in enumerate(zip(valid_paths, predictions)):
-                class_pred = int(np.argmax(pred))
-                confidence = float(np.max(pred))
-                
-                # Verificar umbral de confianza
-                is_reliable = confidence >= self.model_manager.confidence_threshold
+            reliable_rows = []
+            reliable_preds = []
+            for i, path in enumerate(valid_paths):
+                class_pred = class_preds[i]
+                is_reliable = reliable_flags[i]
                 
                 result = {
                     'image_path': path,
                     'prediction': class_pred,
-                    'confidence': round(confidence, 4),
-                    'all_probabilities': [round(float(p), 4) for p in pred],
+                    'confidence': rounded_confidences[i],
+                    'all_probabilities': rounded_probabilities[i],
                     'is_reliable': is_reliable,
                     'model_version': model_version or self.model_manager.current_version,
-                    'processed_at': datetime.now().isoformat()
+                    'processed_at': processed_at
                 }
                 
-                # Generar GradCAM si la confianza es suficiente
+                # GradCAM solo si la confianza es suficiente (se genera en batch abajo)
                 if is_reliable:
-                    try:
-                        gradcam = self._generate_gradcam(images_batch[i], model, class_pred)
-                        result['gradcam'] = gradcam
-                    except Exception as e:
-                        logger.warning(f"Error generando GradCAM para {path}: {e}")
-                        result['gradcam'] = None
+                    reliable_rows.append(i)
+                    reliable_preds.append(class_pred)
                 
                 results.append(result)
             
+            # GradCAM de todas las predicciones confiables en un solo pase
+            if reliable_rows:
+                try:
+                    gradcams = self._generate_gradcam_batch(
+                        images_batch[reliable_rows], reliable_preds,
+                        model_version=model_version or self.model_manager.current_version
+                    )
+                except Exception as e:
+                    logger.warning(f"Error generando GradCAM del batch: {e}")
+                    gradcams = [None] * len(reliable_rows)
+                
+                for i, gradcam in zip(reliable_rows, gradcams):
+                    results[i]['gradcam'] = gradcam
+            
             return results
             
         except Exception as e:
             logger.error(f"Error en procesamiento batch: {e}")
             return []
     
-    def _load_and_preprocess_image(self, image_path: str) -> Optional[np.ndarray]:
-        """Cargar y preprocesar imagen individual"""
+    def _load_and_preprocess_image(self, image_path: str, out: np.ndarray = None) -> Optional[np.ndarray]:
+        """
+        Cargar y preprocesar imagen individual: RGB float32 en [0, 1] con tamaño target_size.
+        Si se pasa `out` (p. ej. una fila del batch), se escribe ahí sin copias extra
+        """
         try:
-            if isinstance(image_path, str) and os.path.exists(image_path):
-                image = Image.open(image_path).convert("RGB")
+            if isinstance(image_path, str):
+                image = cv2.imread(image_path, cv2.IMREAD_COLOR)
             else:
                 # Asumir que es un objeto de imagen de Django
-                image = Image.open(image_path).convert("RGB")
+                image = cv2.imdecode(np.frombuffer(image_path.read(), np.uint8), cv2.IMREAD_COLOR)
+            
+            if image is None:
+                raise ValueError(f"No se pudo decodificar la imagen {image_path}")
+            
+            image = cv2.resize(image, self.target_size, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
             
-            image = image.resize(self.target_size)
-            img_array = np.array(image) / 255.0
-            return img_array
+            if out is None:
+                out = np.empty(image.shape, dtype=np.float32)
+            np.multiply(image, INV_255, out=out, casting='unsafe')
+            return out
             
         except Exception as e:
             logger.error(f"Error preprocesando imagen: {e}")
             return None
     
-    def _generate_gradcam(self, image_array: np.ndarray, model: tf.keras.Model, 
-                         pred_index: int, layer_name: str = None) -> Optional[str]:
-        """Generar GradCAM optimizado"""
-        try:
-            # Auto-detectar capa convolucional si no se especifica
-            if layer_name is None:
-                available_layers = [layer.name for layer in model.layers]
-                conv_layers = [name for name in available_layers if 'conv2d' in name.lower()]
-                
-                if conv_layers:
-                    # Buscar específicamente la segunda capa convolucional
-                    target_conv_layer = None
-                    for layer_name_candidate in conv_layers:
-                        if 'conv2d_2' in layer_name_candidate or (len(conv_layers) >= 2 and layer_name_candidate == conv_layers[1]):
-                            target_conv_layer = layer_name_candidate
-                            break
-                    
-                    # Si no encontramos conv2d_2, usar la última capa conv
-                    if target_conv_layer is None:
-                        target_conv_layer = conv_layers[-1]
-                        
-                    layer_name = target_conv_layer
-                    print(f"✅ ML Auto-detectada capa GradCAM: {layer_name}")
-                else:
-                    # Fallback
-                    candidates = ['conv2d_2_functional_3', 'conv2d_2', 'conv2d_1_functional_0', 'conv2d_1']
-                    for candidate in candidates:
-                        if candidate in available_layers:
-                            layer_name = candidate
-                            break
-                    
-                    if layer_name is None:
-                        layer_name = 'conv2d_2'  # Último recurso
-            
-            # Crear grad_model con reintentos defensivos
-            max_attempts = 3
-            grad_model = None
-            
-            for attempt in range(max_attempts):
-                try:
-                    grad_model = tf.keras.models.Model(
-                        [model.inputs], [model.get_layer(layer_name).output, model.output]
-                    )
-                    print(f"✅ Grad model ML creado en intento {attempt + 1}")
-                    break
-                    
-                except (AttributeError, RuntimeError, ValueError) as e:
-                    print(f"⚠️ Intento ML {attempt + 1} falló: {str(e)}")
-                    if "never been called" in str(e) or "no defined input" in str(e):
-                        print(f"🔥 Forzando inicialización ML (intento {attempt + 1})...")
-                        dummy_input = tf.zeros((1, self.target_size[0], self.target_size[1], 3), dtype=tf.float32)
-                        _ = model(dummy_input, training=False)
-                        print(f"✅ Modelo ML forzado (intento {attempt + 1})")
-                    else:
-                        if attempt == max_attempts - 1:
-                            raise e
-            
-            if grad_model is None:
-                return None
-            
+    def _get_gradcam_fn(self, model_version: str, layer_name: str):
+        """
+        Forward + GradientTape de GradCAM para un batch completo compilados en un único
+        grafo (tf.function), construido una vez por versión y capa. Devuelve los heatmaps
+        normalizados (N, h, w), uno por imagen y clase
+        """
+        cache_key = (model_version, layer_name)
+        gradcam_fn = self._gradcam_fns.get(cache_key)
+        if gradcam_fn is not None:
+            return gradcam_fn
+        
+        grad_model = self.model_manager.get_grad_model(model_version, layer_name)
+        
+        @tf.function(input_signature=[
+            tf.TensorSpec((None, self.target_size[0], self.target_size[1], 3), tf.float32),
+            tf.TensorSpec((None,), tf.int32),
+        ])
+        def gradcam_fn(images_batch, pred_indices):
             with tf.GradientTape() as tape:
-                conv_outputs, predictions = grad_model(np.array([image_array]))
-                class_channel = predictions[:, pred_index]
-            
-            grads = tape.gradient(class_channel, conv_outputs)
-            pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
-            conv_outputs = conv_outputs[0]
-            heatmap = tf.reduce_sum(tf.multiply(pooled_grads, conv_outputs), axis=-1)
-            heatmap = np.maximum(heatmap, 0) / tf.reduce_max(heatmap)
-            heatmap_np = heatmap.numpy()
+                conv_outputs, predictions = grad_model(images_batch)
+                # Canal de la clase predicha de cada muestra (las muestras son independientes,
+                # así que el gradiente de la suma da el gradiente por imagen)
+                class_channels = tf.gather(predictions, pred_indices[:, tf.newaxis], batch_dims=1)
+            grads = tape.gradient(class_channels, conv_outputs)
+            pooled_grads = tf.reduce_mean(grads, axis=(1, 2))
+            heatmaps = tf.nn.relu(tf.einsum('bhwc,bc->bhw', conv_outputs, pooled_grads))
+            # ReLU + normalización por muestra en el grafo: una sola copia a NumPy de los N
+            # heatmaps; el epsilon evita NaN cuando una muestra no tiene activación positiva
+            return heatmaps / (tf.reduce_max(heatmaps, axis=(1, 2), keepdims=True) + 1e-8)
+        
+        self._gradcam_fns[cache_key] = gradcam_fn
+        return gradcam_fn
+    
+    def _generate_gradcam(self, image_array: np.ndarray, pred_index: int,
+                         layer_name: str = None, model_version: str = None,
+                         fmt: str = None) -> Optional[str]:
+        """Generar GradCAM optimizado (con el modelo de model_version)"""
+        return self._generate_gradcam_batch(
+            image_array[np.newaxis], [pred_index], layer_name, model_version, fmt
+        )[0]
+    
+    def _generate_gradcam_batch(self, images_array: np.ndarray, pred_indices: List[int],
+                                layer_name: str = None, model_version: str = None,
+                                fmt: str = None) -> List[Optional[str]]:
+        """
+        Generar GradCAM para un batch: un solo forward/backward para todas las imágenes,
+        y solo el post-procesamiento OpenCV por imagen. El grad model sale siempre de
+        model_version (por defecto la versión actual) vía ModelManager.get_grad_model
+        """
+        try:
+            model_version = model_version or self.model_manager.current_version
+            gradcam_fn = self._get_gradcam_fn(model_version, layer_name)
+            heatmaps = gradcam_fn(
+                tf.convert_to_tensor(images_array, dtype=tf.float32),
+                tf.convert_to_tensor(pred_indices, dtype=tf.int32)
+            ).numpy()
             
+        except Exception as e:
+            logger.error(f"Error generando GradCAM: {e}")
+            return [None] * len(images_array)
+        
+        return [
+            self._render_gradcam(image_array, heatmap_np, fmt)
+            for image_array, heatmap_np in zip(images_array, heatmaps)
+        ]
+    
+    def _get_render_buffers(self) -> Dict[str, np.ndarray]:
+        """Buffers del post-procesamiento GradCAM, por hilo y para clinical_output_size"""
+        buffers = getattr(self._render_buffers, 'buffers', None)
+        if buffers is None or buffers['alpha'].shape[::-1] != tuple(self.clinical_output_size):
+            width, height = self.clinical_output_size
+            buffers = {
+                'levels': np.empty((height, width), dtype=np.uint8),
+                'alpha': np.empty((height, width), dtype=np.float32),
+                'original_weight': np.empty((height, width), dtype=np.float32),
+                'colored': np.empty((height, width, 3), dtype=np.uint8),
+                'blended': np.empty((height, width, 3), dtype=np.uint8),
+            }
+            self._render_buffers.buffers = buffers
+        return buffers
+    
+    def _render_gradcam(self, image_array: np.ndarray, heatmap_np: np.ndarray,
+                        fmt: str = None) -> Optional[str]:
+        """Post-procesamiento clínico de un heatmap GradCAM y codificación a base64"""
+        try:
             # 🔬 PROCESAMIENTO CLÍNICO DE ALTA CALIDAD
             
-            # 1. Trabajar con resolución clínica alta
-            clinical_resolution = (512, 512)
-            original_img = (image_array * 255).astype(np.uint8)
-            original_hires = cv2.resize(original_img, clinical_resolution, interpolation=cv2.INTER_CUBIC)
+            # 1. Trabajar con resolución clínica (por defecto la de salida)
+            clinical_resolution = self.clinical_output_size
+            original_hires = (image_array * 255).astype(np.uint8)
+            if original_hires.shape[1::-1] != clinical_resolution:
+                original_hires = cv2.resize(original_hires, clinical_resolution, interpolation=cv2.INTER_CUBIC)
             
             # 2. Redimensionar heatmap con máxima calidad
             heatmap_hires = cv2.resize(heatmap_np, clinical_resolution, interpolation=cv2.INTER_CUBIC)
             
             # 3. Aplicar sharpening para definición de lesiones
-            kernel_sharpen = np.array([[-1,-1,-1],
-                                     [-1, 9,-1],
-                                     [-1,-1,-1]])
-            heatmap_sharp = cv2.filter2D(heatmap_hires, -1, kernel_sharpen)
-            heatmap_sharp = np.clip(heatmap_sharp, 0, 1)
-            
-            # 4. Stretching de contraste médico
-            p2, p98 = np.percentile(heatmap_sharp, (2, 98))
-            heatmap_contrast = np.clip((heatmap_sharp - p2) / (p98 - p2), 0, 1)
-            
-            # 5. Detección de lesiones por niveles
-            high_activation = heatmap_contrast > 0.7    # Lesiones críticas
-            medium_activation = heatmap_contrast > 0.4  # Lesiones moderadas  
-            low_activation = heatmap_contrast > 0.15    # Activación leve
-            
-            # 6. Gamma correction para resaltar microlesiones
-            heatmap_medical = np.power(heatmap_contrast, 0.7)
-            heatmap_uint8 = np.uint8(255 * heatmap_medical)
-            
-            # 7. Colormap clínico
-            heatmap_colored = cv2.applyColorMap(heatmap_uint8, cv2.COLORMAP_JET)
-            
-            # 8. Superposición estratificada para diagnóstico
-            superimposed = original_hires.copy().astype(np.float64)
-            
-            # Transparencias diferenciadas por severidad
-            alpha_high = 0.6    # Lesiones severas muy visibles
-            alpha_medium = 0.4  # Lesiones moderadas visibles
-            alpha_low = 0.2     # Cambios sutiles
-            
-            # Aplicar superposición por niveles de severidad
-            superimposed[high_activation] = (
-                (1 - alpha_high) * original_hires[high_activation] + 
-                alpha_high * heatmap_colored[high_activation]
-            )
-            
-            superimposed[medium_activation & ~high_activation] = (
-                (1 - alpha_medium) * original_hires[medium_activation & ~high_activation] + 
-                alpha_medium * heatmap_colored[medium_activation & ~high_activation]
-            )
-            
-            superimposed[low_activation & ~medium_activation] = (
-                (1 - alpha_low) * original_hires[low_activation & ~medium_activation] + 
-                alpha_low * heatmap_colored[low_activation & ~medium_activation]
-            )
+            heatmap_sharp = cv2.filter2D(heatmap_hires, -1, self.GRADCAM_SHARPEN_KERNEL)
+            np.clip(heatmap_sharp, 0, 1, out=heatmap_sharp)
+            
+            # Buffers reutilizados entre imágenes (uno por hilo y resolución)
+            buffers = self._get_render_buffers()
+            
+            # 4. Stretching de contraste médico y cuantización a 256 niveles en dos pasadas:
+            # max in-place (recorte inferior en p2) + convertScaleAbs (escala y satura en 255)
+            p2, p98 = fast_percentiles(heatmap_sharp, (2, 98))
+            scale = 255.0 / max(p98 - p2, 1e-8)
+            cv2.max(heatmap_sharp, p2, dst=heatmap_sharp)
+            levels = cv2.convertScaleAbs(heatmap_sharp, buffers['levels'], alpha=scale, beta=-p2 * scale)
+            
+            # 5-7. Detección de lesiones por niveles (alpha por severidad), gamma y colormap
+            # clínico: todo depende solo del nivel, así que son LUTs precalculadas
+            alpha = cv2.LUT(levels, self.GRADCAM_ALPHA_LUT, dst=buffers['alpha'])
+            original_weight = cv2.LUT(levels, self.GRADCAM_ORIGINAL_WEIGHT_LUT, dst=buffers['original_weight'])
+            heatmap_colored = cv2.applyColorMap(levels, self.GRADCAM_COLOR_LUT, dst=buffers['colored'])
+            
+            # 8. Superposición estratificada para diagnóstico, en una sola pasada:
+            # alpha * heatmap + (1 - alpha) * original, saturada a uint8
+            blended = cv2.blendLinear(heatmap_colored, original_hires, alpha, original_weight,
+                                      dst=buffers['blended'])
             
             # 9. Sharpening final para nitidez clínica
-            superimposed = superimposed.astype(np.uint8)
-            kernel_final = np.array([[0,-1,0],
-                                   [-1,5,-1],
-                                   [0,-1,0]]) * 0.3
-            superimposed = cv2.filter2D(superimposed, -1, kernel_final)
-            superimposed = np.clip(superimposed, 0, 255).astype(np.uint8)
+            # (filter2D sobre uint8 ya satura a [0, 255])
+            superimposed = cv2.filter2D(blended, -1, self.GRADCAM_FINAL_KERNEL)
             
             # 10. Redimensionar al tamaño final
             if clinical_resolution != self.target_size:
                 superimposed = cv2.resize(superimposed, self.target_size, interpolation=cv2.INTER_AREA)
             
-            # Convertir a base64
-            pil_img = Image.fromarray(np.uint8(superimposed))
-            buffer = BytesIO()
-            pil_img.save(buffer, format="PNG", quality=85)
-            img_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
+            # Codificar con OpenCV (espera BGR) y convertir a base64
+            fmt = fmt or self.gradcam_format
+            superimposed_bgr = cv2.cvtColor(superimposed, cv2.COLOR_RGB2BGR)
+            if fmt == "png":
+                ok, encoded = cv2.imencode(".png", superimposed_bgr)
+            else:
+                # Croma 4:4:4: con 4:2:0 los bordes saturados del colormap JET se
+                # degradan visiblemente a 96x96
+                ok, encoded = cv2.imencode(".jpg", superimposed_bgr, [
+                    int(cv2.IMWRITE_JPEG_QUALITY), self.GRADCAM_JPEG_QUALITY,
+                    int(cv2.IMWRITE_JPEG_SAMPLING_FACTOR), int(cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444),
+                ])
+            if not ok:
+                raise ValueError(f"No se pudo codificar el GradCAM como {fmt}")
+            img_base64 = base64.b64encode(encoded.tobytes()).decode("utf-8")
             
             return img_base64
             
@@ -377,75 +724,158 @@ class MLCache:
 class ModelMonitor:
     """Monitor de performance y drift del modelo"""
     
+    METRICS_TIMEOUT = 86400 * 7  # 7 días
+    MAX_RECENT_PREDICTIONS = 1000
+    NUM_CLASSES = 5
+    
     def __init__(self):
         self.metrics_cache_key = "ml_model_metrics"
         self.predictions_key = "ml_recent_predictions"
+        # Claves nativas de Redis (hash de contadores + lista acotada de predicciones)
+        self.redis_metrics_key = "ml:metrics"
+        self.redis_predictions_key = "ml:recent"
+        self._redis = None
+        self._redis_checked = False
+    
+    def _get_redis(self):
+        """Cliente Redis nativo si el cache es django-redis; None con otros backends"""
+        if not self._redis_checked:
+            self._redis_checked = True
+            try:
+                from django_redis import get_redis_connection
+                self._redis = get_redis_connection("default")
+            except Exception:
+                self._redis = None
+        return self._redis
     
     def log_prediction(self, result: Dict):
         """Registrar predicción para monitoreo"""
         try:
-            # Obtener métricas actuales
-            metrics = cache.get(self.metrics_cache_key, {
-                'total_predictions': 0,
-                'confidence_sum': 0,
-                'class_distribution': {str(i): 0 for i in range(5)},
-                'low_confidence_count': 0,
-                'last_updated': datetime.now().isoformat()
-            })
-            
-            # Actualizar métricas
-            metrics['total_predictions'] += 1
-            metrics['confidence_sum'] += result['confidence']
-            metrics['class_distribution'][str(result['prediction'])] += 1
-            
-            if not result['is_reliable']:
-                metrics['low_confidence_count'] += 1
-            
-            metrics['last_updated'] = datetime.now().isoformat()
-            metrics['avg_confidence'] = metrics['confidence_sum'] / metrics['total_predictions']
-            
-            # Guardar métricas actualizadas
-            cache.set(self.metrics_cache_key, metrics, timeout=86400 * 7)  # 7 días
-            
-            # Guardar predicciones recientes para análisis de drift
-            recent_preds = cache.get(self.predictions_key, [])
-            recent_preds.append({
-                'prediction': result['prediction'],
-                'confidence': result['confidence'],
-                'timestamp': datetime.now().isoformat()
-            })
-            
-            # Mantener solo las últimas 1000 predicciones
-            if len(recent_preds) > 1000:
-                recent_preds = recent_preds[-1000:]
-            
-            cache.set(self.predictions_key, recent_preds, timeout=86400 * 7)
+            redis_conn = self._get_redis()
+            if redis_conn is not None:
+                self._log_prediction_redis(redis_conn, result)
+            else:
+                self._log_prediction_cache(result)
             
         except Exception as e:
             logger.error(f"Error registrando predicción para monitoreo: {e}")
     
+    def _log_prediction_redis(self, redis_conn, result: Dict):
+        """
+        Actualización atómica con HINCRBY/HINCRBYFLOAT y LPUSH+LTRIM (ring buffer):
+        sin read-modify-write ni re-serializar el historial en cada predicción
+        """
+        now_iso = datetime.now().isoformat()
+        pipe = redis_conn.pipeline()
+        pipe.hincrby(self.redis_metrics_key, 'total_predictions', 1)
+        pipe.hincrbyfloat(self.redis_metrics_key, 'confidence_sum', result['confidence'])
+        pipe.hincrby(self.redis_metrics_key, f"class_{result['prediction']}", 1)
+        if not result['is_reliable']:
+            pipe.hincrby(self.redis_metrics_key, 'low_confidence_count', 1)
+        pipe.hset(self.redis_metrics_key, 'last_updated', now_iso)
+        pipe.expire(self.redis_metrics_key, self.METRICS_TIMEOUT)
+        
+        pipe.lpush(self.redis_predictions_key, json.dumps({
+            'prediction': result['prediction'],
+            'confidence': result['confidence'],
+            'timestamp': now_iso
+        }))
+        pipe.ltrim(self.redis_predictions_key, 0, self.MAX_RECENT_PREDICTIONS - 1)
+        pipe.expire(self.redis_predictions_key, self.METRICS_TIMEOUT)
+        pipe.execute()
+    
+    def _log_prediction_cache(self, result: Dict):
+        """Fallback para caches sin Redis (desarrollo/tests)"""
+        now_iso = datetime.now().isoformat()
+        
+        # Obtener métricas actuales
+        metrics = cache.get(self.metrics_cache_key, {
+            'total_predictions': 0,
+            'confidence_sum': 0,
+            'class_distribution': {str(i): 0 for i in range(self.NUM_CLASSES)},
+            'low_confidence_count': 0,
+            'last_updated': now_iso
+        })
+        
+        # Actualizar métricas
+        metrics['total_predictions'] += 1
+        metrics['confidence_sum'] += result['confidence']
+        metrics['class_distribution'][str(result['prediction'])] += 1
+        
+        if not result['is_reliable']:
+            metrics['low_confidence_count'] += 1
+        
+        metrics['last_updated'] = now_iso
+        metrics['avg_confidence'] = metrics['confidence_sum'] / metrics['total_predictions']
+        
+        # Guardar métricas actualizadas
+        cache.set(self.metrics_cache_key, metrics, timeout=self.METRICS_TIMEOUT)
+        
+        # Guardar predicciones recientes para análisis de drift
+        recent_preds = cache.get(self.predictions_key, [])
+        recent_preds.append({
+            'prediction': result['prediction'],
+            'confidence': result['confidence'],
+            'timestamp': now_iso
+        })
+        
+        # Mantener solo las últimas 1000 predicciones
+        if len(recent_preds) > self.MAX_RECENT_PREDICTIONS:
+            recent_preds = recent_preds[-self.MAX_RECENT_PREDICTIONS:]
+        
+        cache.set(self.predictions_key, recent_preds, timeout=self.METRICS_TIMEOUT)
+    
     def get_model_metrics(self) -> Dict:
         """Obtener métricas del modelo"""
-        return cache.get(self.metrics_cache_key, {})
+        redis_conn = self._get_redis()
+        if redis_conn is None:
+            return cache.get(self.metrics_cache_key, {})
+        
+        raw = {
+            key.decode(): value.decode()
+            for key, value in redis_conn.hgetall(self.redis_metrics_key).items()
+        }
+        if not raw:
+            return {}
+        
+        total = int(raw.get('total_predictions', 0))
+        confidence_sum = float(raw.get('confidence_sum', 0))
+        return {
+            'total_predictions': total,
+            'confidence_sum': confidence_sum,
+            'class_distribution': {
+                str(i): int(raw.get(f'class_{i}', 0)) for i in range(self.NUM_CLASSES)
+            },
+            'low_confidence_count': int(raw.get('low_confidence_count', 0)),
+            'last_updated': raw.get('last_updated'),
+            'avg_confidence': confidence_sum / total if total else 0,
+        }
+    
+    def get_recent_predictions(self, limit: int = None) -> List[Dict]:
+        """Predicciones recientes (de la más antigua a la más nueva), como máximo `limit`"""
+        redis_conn = self._get_redis()
+        if redis_conn is None:
+            recent_preds = cache.get(self.predictions_key, [])
+            return recent_preds[-limit:] if limit else recent_preds
+        
+        end = (limit or self.MAX_RECENT_PREDICTIONS) - 1
+        # LPUSH deja la más nueva al principio
+        return [json.loads(item) for item in reversed(redis_conn.lrange(self.redis_predictions_key, 0, end))]
     
     def detect_drift(self) -> Dict:
         """Detectar drift en las predicciones"""
-        recent_preds = cache.get(self.predictions_key, [])
+        recent_100 = self.get_recent_predictions(100)
         
-        if len(recent_preds) < 100:
+        if len(recent_100) < 100:
             return {'drift_detected': False, 'message': 'Insuficientes datos'}
         
-        # Análisis simple de drift basado en distribución de clases
-        recent_100 = recent_preds[-100:]
-        class_dist = {}
-        avg_confidence = 0
-        
-        for pred in recent_100:
-            class_key = str(pred['prediction'])
-            class_dist[class_key] = class_dist.get(class_key, 0) + 1
-            avg_confidence += pred['confidence']
-        
-        avg_confidence /= len(recent_100)
+        # Análisis simple de drift basado en distribución de clases (vectorizado)
+        sample_size = len(recent_100)
+        predictions = np.fromiter((pred['prediction'] for pred in recent_100), dtype=np.int64, count=sample_size)
+        confidences = np.fromiter((pred['confidence'] for pred in recent_100), dtype=np.float64, count=sample_size)
+        class_counts = np.bincount(predictions, minlength=self.NUM_CLASSES)
+        class_dist = {str(cls): int(count) for cls, count in enumerate(class_counts.tolist()) if count}
+        avg_confidence = float(confidences.mean())
         
         # Detectar anomalías simples
         drift_indicators = []
@@ -454,7 +884,7 @@ class ModelMonitor:
             drift_indicators.append("Confianza promedio baja")
         
         # Verificar si hay clases dominantes inusuales
-        max_class_pct = max(class_dist.values()) / len(recent_100)
+        max_class_pct = class_counts.max() / sample_size
         if max_class_pct > 0.7:
             drift_indicators.append("Distribución de clases sesgada")
         
@@ -463,7 +893,7 @@ class ModelMonitor:
             'indicators': drift_indicators,
             'avg_confidence': round(avg_confidence, 3),
             'class_distribution': class_dist,
-            'sample_size': len(recent_100)
+            'sample_size': sample_size
         }
 
 # Instancias globales
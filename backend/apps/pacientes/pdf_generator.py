@@ -1,121 +1,253 @@
-from reportlab.lib.pagesizes import A4, letter
+from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch, cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle, PageBreak
-from reportlab.platypus.frames import Frame
-from reportlab.platypus.doctemplate import PageTemplate, BaseDocTemplate
-from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT, TA_JUSTIFY
-from reportlab.graphics.shapes import Drawing, Rect, String, Line
-from reportlab.graphics.charts.piecharts import Pie
-from reportlab.graphics import renderPDF
-from PIL import Image as PILImage
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
 import io
 import base64
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Paleta del reporte (HexColor se parsea una sola vez al importar)
+COLOR_PRIMARY = colors.HexColor('#1e40af')   # Azul institucional: títulos, header
+COLOR_HEADING = colors.HexColor('#1f2937')   # Subtítulos
+COLOR_DANGER = colors.HexColor('#dc2626')    # Diagnóstico y confianza baja
+COLOR_SUCCESS = colors.HexColor('#059669')   # Confianza alta
+COLOR_MUTED = colors.HexColor('#6b7280')     # Fecha del header y disclaimer
+COLOR_SUBTLE = colors.HexColor('#9ca3af')    # Número de página e info del sistema
+COLOR_DIVIDER = colors.HexColor('#e5e7eb')   # Líneas separadoras
+COLOR_BORDER = colors.HexColor('#d1d5db')    # Bordes de tablas
+COLOR_LABEL_BG = colors.HexColor('#f3f4f6')  # Fondo de etiquetas
+COLOR_ROW_BG = colors.HexColor('#f9fafb')    # Fondo de filas de datos
+
+# Más allá de 4 procesos la generación de PDFs deja de escalar
+MAX_PDF_WORKERS = 4
+
+# Firmas de PNG y JPEG, los formatos que ReportLab embebe sin pasar por PIL
+PDF_READY_IMAGE_SIGNATURES = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8')
+JPEG_SIGNATURE = b'\xff\xd8'
+
+# Form XObject con la parte estática del header de página
+PAGE_HEADER_FORM = 'hdr_common'
+
+# Resolución con la que se embeben las imágenes del disco, al tamaño dibujado
+PDF_IMAGE_DPI = 200
+PDF_IMAGE_JPEG_QUALITY = 85
+
+# Filas de la tabla de métricas de calidad:
+# (etiqueta, clave, valor por defecto, formato, criterio favorable, texto si cumple, texto si no).
+# Una métrica ausente muestra el valor por defecto y cuenta como criterio no cumplido
+CONFIDENCE_METRIC_ROWS = (
+    ('Varianza entre Modelos', 'variance', 0, '{:.3f}'.format, lambda v: v < 0.01,
+     'Baja varianza indica consenso', 'Alta varianza requiere revisión'),
+    ('Consenso de Modelos', 'consensus', False, lambda v: 'Sí' if v else 'No', bool,
+     'Todos los modelos concuerdan', 'Modelos en desacuerdo'),
+    ('Margen de Confianza', 'margin', 0, '{:.2f}'.format, lambda v: v > 0.3,
+     'Alto margen indica certeza', 'Bajo margen requiere cuidado'),
+    ('Calidad General', 'quality_level', 'No disponible', str, None,
+     'Evaluación integral del diagnóstico', None),
+)
+
+def _build_styles():
+    """
+    Hoja de estilos del reporte: se construye una sola vez al importar el módulo.
+    Paragraph solo lee los estilos, así que se comparte entre reportes y procesos
+    """
+    styles = getSampleStyleSheet()
+
+    # Título principal
+    styles.add(ParagraphStyle(
+        name='CustomTitle',
+        parent=styles['Title'],
+        fontSize=24,
+        spaceAfter=30,
+        textColor=COLOR_PRIMARY,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Bold'
+    ))
+
+    # Subtítulos
+    styles.add(ParagraphStyle(
+        name='CustomHeading1',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceBefore=20,
+        spaceAfter=12,
+        textColor=COLOR_HEADING,
+        fontName='Helvetica-Bold'
+    ))
+
+    # Texto de diagnóstico
+    styles.add(ParagraphStyle(
+        name='DiagnosisText',
+        parent=styles['Normal'],
+        fontSize=14,
+        textColor=COLOR_DANGER,
+        fontName='Helvetica-Bold',
+        spaceBefore=6,
+        spaceAfter=6
+    ))
+
+    # Texto de confianza alta
+    styles.add(ParagraphStyle(
+        name='HighConfidence',
+        parent=styles['Normal'],
+        fontSize=12,
+        textColor=COLOR_SUCCESS,
+        fontName='Helvetica-Bold'
+    ))
+
+    # Texto de confianza baja
+    styles.add(ParagraphStyle(
+        name='LowConfidence',
+        parent=styles['Normal'],
+        fontSize=12,
+        textColor=COLOR_DANGER,
+        fontName='Helvetica-Bold'
+    ))
+
+    # Recomendaciones
+    styles.add(ParagraphStyle(
+        name='Recommendations',
+        parent=styles['Normal'],
+        fontSize=11,
+        spaceBefore=4,
+        spaceAfter=4,
+        leftIndent=20,
+        bulletIndent=10,
+        alignment=TA_JUSTIFY
+    ))
+
+    # Disclaimer y datos del sistema del pie de página
+    styles.add(ParagraphStyle(
+        name='Disclaimer',
+        parent=styles['Normal'],
+        fontSize=9,
+        textColor=COLOR_MUTED,
+        alignment=TA_JUSTIFY
+    ))
+
+    styles.add(ParagraphStyle(
+        name='SystemInfo',
+        parent=styles['Normal'],
+        fontSize=8,
+        textColor=COLOR_SUBTLE,
+        alignment=TA_CENTER
+    ))
+
+    return styles
+
+_STYLES = _build_styles()
+
+# Estilos de tabla: Table.setStyle solo lee los comandos, así que se comparten
+# entre reportes igual que _STYLES
+INFO_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+    ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+])
+PATIENT_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), COLOR_LABEL_BG),
+    ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+    ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 11),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+    ('TOPPADDING', (0, 0), (-1, -1), 12),
+    ('GRID', (0, 0), (-1, -1), 1, COLOR_BORDER),
+])
+IMAGES_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('PADDING', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, COLOR_BORDER),
+])
+METRICS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), COLOR_PRIMARY),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, COLOR_BORDER),
+    ('BACKGROUND', (0, 1), (-1, -1), COLOR_ROW_BG),
+])
+FOOTER_LINE_STYLE = TableStyle([
+    ('LINEABOVE', (0, 0), (-1, -1), 2, COLOR_DIVIDER),
+])
+
+@lru_cache(maxsize=128)
+def _load_image_bytes(image_path, mtime_ns, width):
+    """
+    Imagen del disco lista para el PDF: JPEG a PDF_IMAGE_DPI para el ancho dibujado,
+    cacheada entre reportes. mtime_ns forma parte de la clave, así que un archivo
+    modificado se vuelve a procesar
+    """
+    # PIL solo se necesita al preparar imágenes (import diferido)
+    from PIL import Image as PILImage
+
+    with open(image_path, 'rb') as f:
+        image_data = f.read()
+
+    target_px = int(width / inch * PDF_IMAGE_DPI)
+    pil_image = PILImage.open(io.BytesIO(image_data))
+    source_width, source_height = pil_image.size
+    if image_data.startswith(JPEG_SIGNATURE) and max(source_width, source_height) <= target_px:
+        return image_data
+
+    # Se dibuja en un cuadrado de width x width: cada eje se limita por separado
+    # (thumbnail conservaría el aspecto y dejaría el eje corto por debajo de la resolución)
+    pil_image = pil_image.convert('RGB')
+    target_size = (min(source_width, target_px), min(source_height, target_px))
+    if target_size != pil_image.size:
+        pil_image = pil_image.resize(target_size, PILImage.LANCZOS)
+
+    jpeg_buffer = io.BytesIO()
+    pil_image.save(jpeg_buffer, 'JPEG', quality=PDF_IMAGE_JPEG_QUALITY, optimize=True)
+    return jpeg_buffer.getvalue()
+
 class ProfessionalReportPDF:
     """Generador de PDF profesional para reportes médicos"""
 
     def __init__(self):
         self.doc = None
         self.story = []
-        self.styles = getSampleStyleSheet()
-        self._create_custom_styles()
-
-    def _create_custom_styles(self):
-        """Crear estilos personalizados profesionales"""
-
-        # Título principal
-        self.styles.add(ParagraphStyle(
-            name='CustomTitle',
-            parent=self.styles['Title'],
-            fontSize=24,
-            spaceAfter=30,
-            textColor=colors.HexColor('#1e40af'),
-            alignment=TA_CENTER,
-            fontName='Helvetica-Bold'
-        ))
-
-        # Subtítulos
-        self.styles.add(ParagraphStyle(
-            name='CustomHeading1',
-            parent=self.styles['Heading1'],
-            fontSize=16,
-            spaceBefore=20,
-            spaceAfter=12,
-            textColor=colors.HexColor('#1f2937'),
-            fontName='Helvetica-Bold'
-        ))
-
-        # Texto de diagnóstico
-        self.styles.add(ParagraphStyle(
-            name='DiagnosisText',
-            parent=self.styles['Normal'],
-            fontSize=14,
-            textColor=colors.HexColor('#dc2626'),
-            fontName='Helvetica-Bold',
-            spaceBefore=6,
-            spaceAfter=6
-        ))
-
-        # Texto de confianza alta
-        self.styles.add(ParagraphStyle(
-            name='HighConfidence',
-            parent=self.styles['Normal'],
-            fontSize=12,
-            textColor=colors.HexColor('#059669'),
-            fontName='Helvetica-Bold'
-        ))
-
-        # Texto de confianza baja
-        self.styles.add(ParagraphStyle(
-            name='LowConfidence',
-            parent=self.styles['Normal'],
-            fontSize=12,
-            textColor=colors.HexColor('#dc2626'),
-            fontName='Helvetica-Bold'
-        ))
-
-        # Recomendaciones
-        self.styles.add(ParagraphStyle(
-            name='Recommendations',
-            parent=self.styles['Normal'],
-            fontSize=11,
-            spaceBefore=4,
-            spaceAfter=4,
-            leftIndent=20,
-            bulletIndent=10,
-            alignment=TA_JUSTIFY
-        ))
-
-    def generate_professional_report(self, reporte_data, output_path=None):
-        """Generar reporte PDF profesional completo"""
+        self.styles = _STYLES
+
+    def generate_professional_report(self, reporte_data, output=None):
+        """
+        Generar reporte PDF profesional completo
+
+        output puede ser una ruta, un file-like (p. ej. el HttpResponse de la vista,
+        que recibe el PDF sin copia intermedia) o None para devolver los bytes
+
+        En reporte_data['diagnostico'], 'confianza_pct' es la confianza numérica
+        (0-100) y 'confianza' el texto a mostrar; basta con uno de los dos
+        """
         try:
             # Configurar documento
-            if output_path is None:
-                buffer = io.BytesIO()
-                self.doc = SimpleDocTemplate(
-                    buffer,
-                    pagesize=A4,
-                    rightMargin=2*cm,
-                    leftMargin=2*cm,
-                    topMargin=2*cm,
-                    bottomMargin=2*cm
-                )
-            else:
-                self.doc = SimpleDocTemplate(
-                    output_path,
-                    pagesize=A4,
-                    rightMargin=2*cm,
-                    leftMargin=2*cm,
-                    topMargin=2*cm,
-                    bottomMargin=2*cm
-                )
+            buffer = io.BytesIO() if output is None else None
+            self.doc = SimpleDocTemplate(
+                buffer if output is None else output,
+                pagesize=A4,
+                rightMargin=2*cm,
+                leftMargin=2*cm,
+                topMargin=2*cm,
+                bottomMargin=2*cm
+            )
 
             self.story = []
 
@@ -132,55 +264,63 @@ class ProfessionalReportPDF:
             # Generar PDF
             self.doc.build(self.story, onFirstPage=self._add_page_header, onLaterPages=self._add_page_header)
 
-            if output_path is None:
+            if output is None:
                 pdf_data = buffer.getvalue()
                 buffer.close()
                 return pdf_data
 
-            logger.info(f"Reporte PDF generado: {output_path}")
-            return output_path
+            logger.info("Reporte PDF generado: %s", output)
+            return output
 
         except Exception as e:
-            logger.error(f"Error generando PDF: {e}")
+            logger.error("Error generando PDF: %s", e)
             raise
 
     def _add_page_header(self, canvas, doc):
         """Agregar header profesional a cada página"""
+        # La parte estática (incluida la fecha, fija durante todo el build) se dibuja
+        # una sola vez por documento como Form XObject; cada página solo la referencia
+        if not canvas.hasForm(PAGE_HEADER_FORM):
+            self._draw_static_page_header(canvas)
+
         canvas.saveState()
+        canvas.doForm(PAGE_HEADER_FORM)
+
+        # Footer con número de página
+        canvas.setFont('Helvetica', 9)
+        canvas.setFillColor(COLOR_SUBTLE)
+        canvas.drawCentredString(A4[0] / 2, 1*cm, f"Página {doc.page}")
+
+        canvas.restoreState()
+
+    def _draw_static_page_header(self, canvas):
+        """Form XObject del header: líneas, título del sistema y fecha de generación"""
+        canvas.beginForm(PAGE_HEADER_FORM)
 
-        # Línea superior
-        canvas.setStrokeColor(colors.HexColor('#1e40af'))
+        # Líneas superior e inferior del header
+        canvas.setStrokeColor(COLOR_PRIMARY)
         canvas.setLineWidth(3)
         canvas.line(2*cm, A4[1] - 1.5*cm, A4[0] - 2*cm, A4[1] - 1.5*cm)
+        canvas.setStrokeColor(COLOR_DIVIDER)
+        canvas.setLineWidth(1)
+        canvas.line(2*cm, A4[1] - 1.8*cm, A4[0] - 2*cm, A4[1] - 1.8*cm)
 
         # Título del sistema
         canvas.setFont('Helvetica-Bold', 12)
-        canvas.setFillColor(colors.HexColor('#1e40af'))
+        canvas.setFillColor(COLOR_PRIMARY)
         canvas.drawString(2*cm, A4[1] - 1.2*cm, "Sistema de Diagnóstico de Retinopatía Diabética")
 
         # Fecha y hora
         canvas.setFont('Helvetica', 10)
-        canvas.setFillColor(colors.HexColor('#6b7280'))
+        canvas.setFillColor(COLOR_MUTED)
         fecha_actual = datetime.now().strftime("%d/%m/%Y %H:%M")
         canvas.drawRightString(A4[0] - 2*cm, A4[1] - 1.2*cm, f"Generado: {fecha_actual}")
 
-        # Línea inferior del header
-        canvas.setStrokeColor(colors.HexColor('#e5e7eb'))
-        canvas.setLineWidth(1)
-        canvas.line(2*cm, A4[1] - 1.8*cm, A4[0] - 2*cm, A4[1] - 1.8*cm)
-
-        # Footer con número de página
-        canvas.setFont('Helvetica', 9)
-        canvas.setFillColor(colors.HexColor('#9ca3af'))
-        canvas.drawCentredText(A4[0] / 2, 1*cm, f"Página {doc.page}")
-
-        canvas.restoreState()
+        canvas.endForm()
 
     def _add_header(self, reporte_data):
         """Agregar encabezado del reporte"""
         title = Paragraph("REPORTE MÉDICO DE RETINOPATÍA DIABÉTICA", self.styles['CustomTitle'])
-        self.story.append(title)
-        self.story.append(Spacer(1, 20))
 
         # Información del reporte
         report_info = [
@@ -191,22 +331,13 @@ class ProfessionalReportPDF:
         ]
 
         info_table = Table(report_info, colWidths=[4*cm, 10*cm])
-        info_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
-
-        self.story.append(info_table)
-        self.story.append(Spacer(1, 30))
+        info_table.setStyle(INFO_TABLE_STYLE)
+
+        self.story.extend([title, Spacer(1, 20), info_table, Spacer(1, 30)])
 
     def _add_patient_info(self, paciente_data):
         """Sección de información del paciente"""
         title = Paragraph("INFORMACIÓN DEL PACIENTE", self.styles['CustomHeading1'])
-        self.story.append(title)
 
         # Crear tabla de información del paciente
         patient_data = [
@@ -219,36 +350,27 @@ class ProfessionalReportPDF:
         ]
 
         patient_table = Table(patient_data, colWidths=[4*cm, 10*cm])
-        patient_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
-            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ('TOPPADDING', (0, 0), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#d1d5db')),
-        ]))
-
-        self.story.append(patient_table)
-        self.story.append(Spacer(1, 25))
+        patient_table.setStyle(PATIENT_TABLE_STYLE)
+
+        self.story.extend([title, patient_table, Spacer(1, 25)])
 
     def _add_diagnosis_section(self, diagnostico_data):
         """Sección de diagnóstico principal"""
         title = Paragraph("DIAGNÓSTICO", self.styles['CustomHeading1'])
-        self.story.append(title)
 
         # Diagnóstico principal destacado
         diagnosis_text = Paragraph(
             f"<b>Resultado:</b> {diagnostico_data['resultado']}",
             self.styles['DiagnosisText']
         )
-        self.story.append(diagnosis_text)
 
         # Análisis de confianza
-        confidence_value = float(diagnostico_data['confianza'].replace('%', ''))
+        confidence_value = diagnostico_data.get('confianza_pct')
+        if confidence_value is None:
+            # Datos con el contrato anterior: solo el texto, p. ej. "87.5%"
+            confidence_value = float(diagnostico_data['confianza'].replace('%', ''))
+        confidence_display = diagnostico_data.get('confianza') or f"{confidence_value:.1f}%"
+
         if confidence_value >= 85:
             confidence_style = 'HighConfidence'
             confidence_interpretation = "ALTA CONFIANZA - Diagnóstico confiable"
@@ -260,230 +382,197 @@ class ProfessionalReportPDF:
             confidence_interpretation = "BAJA CONFIANZA - Revisión manual requerida"
 
         confidence_text = Paragraph(
-            f"<b>Confianza del Modelo:</b> {diagnostico_data['confianza']}",
+            f"<b>Confianza del Modelo:</b> {confidence_display}",
             self.styles[confidence_style]
         )
-        self.story.append(confidence_text)
 
         interpretation_text = Paragraph(
             f"<b>Interpretación:</b> {confidence_interpretation}",
             self.styles['Normal']
         )
-        self.story.append(interpretation_text)
-        self.story.append(Spacer(1, 20))
+
+        self.story.extend([title, diagnosis_text, confidence_text, interpretation_text, Spacer(1, 20)])
 
     def _add_images_section(self, imagenes_data):
         """Sección de imágenes médicas"""
         title = Paragraph("IMÁGENES MÉDICAS", self.styles['CustomHeading1'])
-        self.story.append(title)
-
-        # Crear tabla para mostrar imágenes lado a lado
-        images_row = []
 
         # Imagen de retina
-        if imagenes_data.get('retina_url'):
-            try:
-                retina_img = self._process_image_for_pdf(imagenes_data['retina_url'], width=6*cm)
-                retina_cell = [
-                    Paragraph("<b>Imagen de Retina</b>", self.styles['Normal']),
-                    retina_img
-                ]
-            except:
-                retina_cell = [
-                    Paragraph("<b>Imagen de Retina</b>", self.styles['Normal']),
-                    Paragraph("Imagen no disponible", self.styles['Normal'])
-                ]
-        else:
-            retina_cell = [
-                Paragraph("<b>Imagen de Retina</b>", self.styles['Normal']),
-                Paragraph("Imagen no disponible", self.styles['Normal'])
-            ]
+        retina_cell = self._make_image_cell(
+            "Imagen de Retina", "Imagen no disponible",
+            self._process_image_for_pdf, imagenes_data.get('retina_url')
+        )
 
-        # Imagen GradCAM
+        # Imagen GradCAM (base64 o archivo)
         if imagenes_data.get('gradcam_base64'):
-            try:
-                gradcam_img = self._process_base64_image_for_pdf(imagenes_data['gradcam_base64'], width=6*cm)
-                gradcam_cell = [
-                    Paragraph("<b>GradCAM - Análisis IA</b>", self.styles['Normal']),
-                    gradcam_img
-                ]
-            except:
-                gradcam_cell = [
-                    Paragraph("<b>GradCAM - Análisis IA</b>", self.styles['Normal']),
-                    Paragraph("Análisis no disponible", self.styles['Normal'])
-                ]
-        elif imagenes_data.get('gradcam_url'):
-            try:
-                gradcam_img = self._process_image_for_pdf(imagenes_data['gradcam_url'], width=6*cm)
-                gradcam_cell = [
-                    Paragraph("<b>GradCAM - Análisis IA</b>", self.styles['Normal']),
-                    gradcam_img
-                ]
-            except:
-                gradcam_cell = [
-                    Paragraph("<b>GradCAM - Análisis IA</b>", self.styles['Normal']),
-                    Paragraph("Análisis no disponible", self.styles['Normal'])
-                ]
+            gradcam_loader, gradcam_source = self._process_base64_image_for_pdf, imagenes_data['gradcam_base64']
         else:
-            gradcam_cell = [
-                Paragraph("<b>GradCAM - Análisis IA</b>", self.styles['Normal']),
-                Paragraph("Análisis no disponible", self.styles['Normal'])
-            ]
+            gradcam_loader, gradcam_source = self._process_image_for_pdf, imagenes_data.get('gradcam_url')
+        gradcam_cell = self._make_image_cell(
+            "GradCAM - Análisis IA", "Análisis no disponible", gradcam_loader, gradcam_source
+        )
 
         # Crear tabla de imágenes
         images_table = Table([[retina_cell, gradcam_cell]], colWidths=[8*cm, 8*cm])
-        images_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('PADDING', (0, 0), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#d1d5db')),
-        ]))
+        images_table.setStyle(IMAGES_TABLE_STYLE)
+
+        self.story.extend([title, images_table, Spacer(1, 25)])
+
+    def _make_image_cell(self, caption, fallback_text, loader, source):
+        """Celda [título, imagen] de la tabla de imágenes, con texto alternativo si no hay imagen"""
+        image = None
+        if source:
+            try:
+                image = loader(source, width=6*cm)
+            except Exception:
+                image = None
 
-        self.story.append(images_table)
-        self.story.append(Spacer(1, 25))
+        if image is None:
+            image = Paragraph(fallback_text, self.styles['Normal'])
+
+        return [Paragraph(f"<b>{caption}</b>", self.styles['Normal']), image]
 
     def _add_confidence_analysis(self, confidence_data):
         """Sección de análisis de confianza detallado"""
         if not confidence_data:
             return
 
-        title = Paragraph("ANÁLISIS DE CONFIANZA MEJORADO", self.styles['CustomHeading1'])
-        self.story.append(title)
+        self.story.append(Paragraph("ANÁLISIS DE CONFIANZA MEJORADO", self.styles['CustomHeading1']))
 
         # Métricas de calidad
         if 'quality_metrics' in confidence_data:
             metrics = confidence_data['quality_metrics']
 
-            analysis_data = [
-                ['Métrica', 'Valor', 'Interpretación'],
-                ['Varianza entre Modelos', f"{metrics.get('variance', 0):.3f}",
-                 'Baja varianza indica consenso' if metrics.get('variance', 1) < 0.01 else 'Alta varianza requiere revisión'],
-                ['Consenso de Modelos', 'Sí' if metrics.get('consensus', False) else 'No',
-                 'Todos los modelos concuerdan' if metrics.get('consensus', False) else 'Modelos en desacuerdo'],
-                ['Margen de Confianza', f"{metrics.get('margin', 0):.2f}",
-                 'Alto margen indica certeza' if metrics.get('margin', 0) > 0.3 else 'Bajo margen requiere cuidado'],
-                ['Calidad General', metrics.get('quality_level', 'No disponible'),
-                 'Evaluación integral del diagnóstico']
-            ]
+            analysis_data = [['Métrica', 'Valor', 'Interpretación']]
+            for label, key, default, fmt, check, ok_text, bad_text in CONFIDENCE_METRIC_ROWS:
+                value = metrics.get(key)
+                passed = check is None or (value is not None and check(value))
+                analysis_data.append([
+                    label,
+                    fmt(default if value is None else value),
+                    ok_text if passed else bad_text
+                ])
 
             metrics_table = Table(analysis_data, colWidths=[5*cm, 3*cm, 8*cm])
-            metrics_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 11),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 10),
-                ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#d1d5db')),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f9fafb')),
-            ]))
-
-            self.story.append(metrics_table)
-            self.story.append(Spacer(1, 20))
+            metrics_table.setStyle(METRICS_TABLE_STYLE)
+
+            self.story.extend([metrics_table, Spacer(1, 20)])
 
     def _add_treatment_plan(self, plan_data):
         """Sección del plan de tratamiento"""
         title = Paragraph("PLAN DE TRATAMIENTO", self.styles['CustomHeading1'])
-        self.story.append(title)
 
         plan_text = Paragraph(
             f"<b>Plan Sugerido:</b> {plan_data['plan_sugerido']}",
             self.styles['Normal']
         )
-        self.story.append(plan_text)
-        self.story.append(Spacer(1, 15))
+
+        self.story.extend([title, plan_text, Spacer(1, 15)])
 
     def _add_recommendations(self, plan_data):
         """Sección de recomendaciones"""
-        title = Paragraph("RECOMENDACIONES MÉDICAS", self.styles['CustomHeading1'])
-        self.story.append(title)
+        section = [Paragraph("RECOMENDACIONES MÉDICAS", self.styles['CustomHeading1'])]
 
         if plan_data.get('recomendaciones'):
-            for rec in plan_data['recomendaciones']:
-                if rec.strip():
-                    bullet_text = Paragraph(f"• {rec}", self.styles['Recommendations'])
-                    self.story.append(bullet_text)
-
-            self.story.append(Spacer(1, 15))
+            section.extend(
+                Paragraph(f"• {rec}", self.styles['Recommendations'])
+                for rec in plan_data['recomendaciones'] if rec.strip()
+            )
+            section.append(Spacer(1, 15))
 
         if plan_data.get('observaciones'):
-            obs_title = Paragraph("<b>Observaciones Adicionales:</b>", self.styles['Normal'])
-            self.story.append(obs_title)
-            obs_text = Paragraph(plan_data['observaciones'], self.styles['Normal'])
-            self.story.append(obs_text)
+            section.append(Paragraph("<b>Observaciones Adicionales:</b>", self.styles['Normal']))
+            section.append(Paragraph(plan_data['observaciones'], self.styles['Normal']))
+
+        self.story.extend(section)
 
     def _add_footer(self, metadatos):
         """Pie de página con información legal"""
-        self.story.append(Spacer(1, 30))
-
         # Línea separadora
         line = Table([['', '']], colWidths=[16*cm])
-        line.setStyle(TableStyle([
-            ('LINEABOVE', (0, 0), (-1, -1), 2, colors.HexColor('#e5e7eb')),
-        ]))
-        self.story.append(line)
-        self.story.append(Spacer(1, 10))
+        line.setStyle(FOOTER_LINE_STYLE)
 
         # Disclaimer médico
         disclaimer = Paragraph(
             "<b>NOTA IMPORTANTE:</b> Este reporte ha sido generado por un sistema de inteligencia artificial "
             "para apoyo al diagnóstico médico. Los resultados deben ser interpretados por un profesional "
             "médico calificado. Este sistema no reemplaza el juicio clínico profesional.",
-            ParagraphStyle('Disclaimer', parent=self.styles['Normal'], fontSize=9,
-                         textColor=colors.HexColor('#6b7280'), alignment=TA_JUSTIFY)
+            self.styles['Disclaimer']
         )
-        self.story.append(disclaimer)
-
-        self.story.append(Spacer(1, 10))
 
         # Información del sistema
         system_info = Paragraph(
             f"Sistema de Diagnóstico de Retinopatía Diabética v{metadatos.get('version', '1.0')} | "
             f"Reporte ID: {metadatos['reporte_id']}",
-            ParagraphStyle('SystemInfo', parent=self.styles['Normal'], fontSize=8,
-                         textColor=colors.HexColor('#9ca3af'), alignment=TA_CENTER)
+            self.styles['SystemInfo']
         )
-        self.story.append(system_info)
+
+        self.story.extend([
+            Spacer(1, 30), line, Spacer(1, 10),
+            disclaimer, Spacer(1, 10),
+            system_info
+        ])
 
     def _process_image_for_pdf(self, image_path, width=6*cm):
         """Procesar imagen para inclusión en PDF"""
         try:
             if os.path.exists(image_path):
-                img = Image(image_path, width=width, height=width)
+                image_data = _load_image_bytes(image_path, os.stat(image_path).st_mtime_ns, width)
+                # Un Image nuevo por uso: ReportLab no permite compartirlo entre stories
+                img = Image(io.BytesIO(image_data), width=width, height=width)
                 return img
             else:
                 return Paragraph("Imagen no encontrada", self.styles['Normal'])
         except Exception as e:
-            logger.error(f"Error procesando imagen: {e}")
+            logger.error("Error procesando imagen: %s", e)
             return Paragraph("Error cargando imagen", self.styles['Normal'])
 
     def _process_base64_image_for_pdf(self, base64_data, width=6*cm):
-        """Procesar imagen base64 para PDF"""
+        """Procesar imagen base64 para PDF (en memoria, sin archivos temporales)"""
         try:
             # Decodificar base64
             image_data = base64.b64decode(base64_data)
 
-            # Crear imagen PIL
-            pil_image = PILImage.open(io.BytesIO(image_data))
-
-            # Guardar temporalmente
-            temp_path = f"/tmp/gradcam_{datetime.now().microsecond}.png"
-            pil_image.save(temp_path, 'PNG')
+            # ReportLab lee PNG/JPEG directamente; otros formatos se re-codifican a PNG
+            if not image_data.startswith(PDF_READY_IMAGE_SIGNATURES):
+                from PIL import Image as PILImage
+                pil_image = PILImage.open(io.BytesIO(image_data))
+                png_buffer = io.BytesIO()
+                pil_image.save(png_buffer, 'PNG')
+                image_data = png_buffer.getvalue()
 
             # Crear objeto Image para ReportLab
-            img = Image(temp_path, width=width, height=width)
-
-            # Limpiar archivo temporal
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-
-            return img
+            return Image(io.BytesIO(image_data), width=width, height=width)
 
         except Exception as e:
-            logger.error(f"Error procesando imagen base64: {e}")
+            logger.error("Error procesando imagen base64: %s", e)
             return Paragraph("GradCAM no disponible", self.styles['Normal'])
 
-# Instancia global
-pdf_generator = ProfessionalReportPDF()
\ No newline at end of file
+def generate_report(reporte_data, output=None):
+    """
+    Generar un reporte PDF con un generador propio (self.doc/self.story no se
+    comparten entre llamadas concurrentes)
+    """
+    return ProfessionalReportPDF().generate_professional_report(reporte_data, output)
+
+def _generate_report_bytes(reporte_data):
+    """Worker de generate_reports_bulk (top-level para poder serializarlo al pool)"""
+    return generate_report(reporte_data)
+
+def generate_reports_bulk(reportes_data, max_workers=None):
+    """
+    Generar varios reportes PDF en paralelo, uno por proceso (ReportLab es CPU-bound
+    y el GIL impide paralelizarlo con hilos). Devuelve los bytes en el mismo orden
+    """
+    reportes_data = list(reportes_data)
+    workers = max_workers or min(os.cpu_count() or 1, MAX_PDF_WORKERS, len(reportes_data))
+
+    # Camino síncrono: sin coste de arrancar procesos para uno solo
+    if workers <= 1:
+        return [generate_report(reporte_data) for reporte_data in reportes_data]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pdfs = list(executor.map(_generate_report_bytes, reportes_data))
+
+    logger.info("%d reportes PDF generados con %d procesos", len(pdfs), workers)
+    return pdfs
\ No newline at end of file
@@ -30,28 +30,109 @@ import seaborn as sns
 
 logger = logging.getLogger(__name__)
 
+# Textos clínicos por grado de retinopatía (0-4), fijos para todos los reportes
+RESULTADOS_MAP = {
+    0: "Sin retinopatía diabética",
+    1: "Retinopatía diabética leve",
+    2: "Retinopatía diabética moderada",
+    3: "Retinopatía diabética severa",
+    4: "Retinopatía diabética proliferativa"
+}
+
+# Severidad y clave de color en ProfessionalPDFReport._COLORS
+SEVERIDAD_MAP = {
+    0: ("NORMAL", 'success'),
+    1: ("LEVE", 'info'),
+    2: ("MODERADA", 'warning'),
+    3: ("SEVERA", 'danger'),
+    4: ("CRÍTICA", 'danger')
+}
+
+CLINICAL_INTERPRETATIONS = {
+    0: "No se detectan signos de retinopatía diabética. La retina presenta características normales según el análisis automatizado.",
+    1: "Se detectan signos leves de retinopatía diabética. Recomendable seguimiento periódico y control glucémico estricto.",
+    2: "Retinopatía diabética moderada detectada. Se requiere evaluación oftalmológica especializada y posible intervención.",
+    3: "Retinopatía diabética severa identificada. Necesita atención oftalmológica urgente y evaluación para tratamiento inmediato.",
+    4: "Retinopatía diabética proliferativa detectada. URGENTE: Requiere intervención oftalmológica inmediata para prevenir pérdida visual."
+}
+
+RECOMMENDATIONS_BY_SEVERITY = {
+    0: (  # Sin retinopatía
+        "Control oftalmológico anual como mínimo",
+        "Mantener control glucémico óptimo (HbA1c < 7%)",
+        "Monitoreo de presión arterial",
+        "Control de lípidos séricos"
+    ),
+    1: (  # Leve
+        "Control oftalmológico cada 6-12 meses",
+        "Optimización del control glucémico",
+        "Control de factores de riesgo cardiovascular",
+        "Educación sobre autocuidado diabético"
+    ),
+    2: (  # Moderada
+        "Evaluación oftalmológica cada 3-6 meses",
+        "Considerar referencia a oftalmólogo especialista en retina",
+        "Control glucémico estricto",
+        "Evaluación de necesidad de tratamiento láser"
+    ),
+    3: (  # Severa
+        "URGENTE: Referencia inmediata a oftalmólogo especialista",
+        "Evaluación para fotocoagulación panretiniana",
+        "Control metabólico estricto",
+        "Seguimiento oftalmológico cada 2-3 meses"
+    ),
+    4: (  # Proliferativa
+        "CRÍTICO: Atención oftalmológica de emergencia",
+        "Evaluación inmediata para vitrectomía si necesario",
+        "Fotocoagulación panretiniana urgente",
+        "Hospitalización si hay hemorragia vítrea"
+    )
+}
+
+FOLLOWUP_SCHEDULES = {
+    0: "Control anual. Próxima evaluación recomendada en 12 meses.",
+    1: "Control semestral. Próxima evaluación en 6 meses, con especialista en 12 meses si no hay cambios.",
+    2: "Control trimestral. Evaluación por especialista en retina dentro de 1-2 meses.",
+    3: "Control mensual. Referencia URGENTE a especialista dentro de 1-2 semanas.",
+    4: "Seguimiento inmediato. Atención de emergencia dentro de 24-48 horas."
+}
+
 class ProfessionalPDFReport:
     """
     Generador de reportes PDF profesionales para diagnóstico de retinopatía diabética
     Incluye visualizaciones médicas, análisis de confianza y recomendaciones
     """
 
+    # Paleta del reporte: HexColor se parsea una sola vez al importar
+    _COLORS = {
+        'primary': HexColor('#2E86AB'),
+        'secondary': HexColor('#A23B72'),
+        'success': HexColor('#2ECC71'),
+        'warning': HexColor('#F39C12'),
+        'danger': HexColor('#E74C3C'),
+        'info': HexColor('#3498DB'),
+        'dark': HexColor('#2C3E50'),
+        'light_gray': HexColor('#ECF0F1'),
+        'medical_blue': HexColor('#1E3A8A'),
+        'medical_green': HexColor('#059669')
+    }
+
+    # Hoja de estilos compartida por todas las instancias (ver _get_styles)
+    _styles_cache = None
+
     def __init__(self):
-        self.styles = self._create_custom_styles()
-        self.colors = {
-            'primary': HexColor('#2E86AB'),
-            'secondary': HexColor('#A23B72'),
-            'success': HexColor('#2ECC71'),
-            'warning': HexColor('#F39C12'),
-            'danger': HexColor('#E74C3C'),
-            'info': HexColor('#3498DB'),
-            'dark': HexColor('#2C3E50'),
-            'light_gray': HexColor('#ECF0F1'),
-            'medical_blue': HexColor('#1E3A8A'),
-            'medical_green': HexColor('#059669')
-        }
-
-    def _create_custom_styles(self):
+        self.styles = type(self)._get_styles()
+        self.colors = self._COLORS
+
+    @classmethod
+    def _get_styles(cls):
+        """Estilos del reporte, construidos en el primer uso y reutilizados después"""
+        if cls._styles_cache is None:
+            cls._styles_cache = cls._create_custom_styles()
+        return cls._styles_cache
+
+    @classmethod
+    def _create_custom_styles(cls):
         """Crea estilos personalizados para el reporte médico"""
         styles = getSampleStyleSheet()
 
@@ -175,8 +256,11 @@ class ProfessionalPDFReport:
             # Construir contenido
             story = []
 
+            # Una sola marca de tiempo para todo el reporte (encabezado y detalles técnicos)
+            generated_at = datetime.now()
+
             # 1. Encabezado principal
-            self._add_header(story, patient_data)
+            self._add_header(story, patient_data, generated_at)
 
             # 2. Información del paciente
             self._add_patient_info(story, patient_data)
@@ -195,7 +279,7 @@ class ProfessionalPDFReport:
             self._add_clinical_recommendations(story, diagnosis_data, confidence_analysis)
 
             # 7. Información técnica
-            self._add_technical_details(story, diagnosis_data, confidence_analysis)
+            self._add_technical_details(story, diagnosis_data, confidence_analysis, generated_at)
 
             # 8. Pie de página con disclaimer
             self._add_disclaimer(story)
@@ -214,7 +298,7 @@ class ProfessionalPDFReport:
             logger.error(f"Error generando reporte PDF: {e}")
             raise
 
-    def _add_header(self, story: List, patient_data: Dict):
+    def _add_header(self, story: List, patient_data: Dict, generated_at: datetime):
         """Agrega encabezado principal del reporte"""
         # Logo o título institucional (si tienes logo, añádelo aquí)
         story.append(Paragraph(
@@ -232,7 +316,7 @@ class ProfessionalPDFReport:
 
         # Información del reporte
         report_info = [
-            ["Fecha del Reporte:", datetime.now().strftime("%d/%m/%Y %H:%M")],
+            ["Fecha del Reporte:", generated_at.strftime("%d/%m/%Y %H:%M")],
             ["Número de Historia:", patient_data.get('historia_clinica', 'N/A')],
             ["Sistema:", "IA Retinopatía v2.0"],
         ]
@@ -289,29 +373,12 @@ class ProfessionalPDFReport:
         """Agrega sección de diagnóstico principal"""
         story.append(Paragraph("DIAGNÓSTICO PRINCIPAL", self.styles['SectionHeader']))
 
-        # Mapeo de resultados
-        resultados_map = {
-            0: "Sin retinopatía diabética",
-            1: "Retinopatía diabética leve",
-            2: "Retinopatía diabética moderada",
-            3: "Retinopatía diabética severa",
-            4: "Retinopatía diabética proliferativa"
-        }
-
-        # Severidad y color
-        severidad_map = {
-            0: ("NORMAL", self.colors['success']),
-            1: ("LEVE", self.colors['info']),
-            2: ("MODERADA", self.colors['warning']),
-            3: ("SEVERA", self.colors['danger']),
-            4: ("CRÍTICA", self.colors['danger'])
-        }
-
         resultado = diagnosis_data.get('resultado', 0)
         confianza = float(diagnosis_data.get('confianza', 0))
 
-        diagnóstico = resultados_map.get(resultado, "Resultado desconocido")
-        severidad, color_severidad = severidad_map.get(resultado, ("DESCONOCIDO", self.colors['dark']))
+        diagnóstico = RESULTADOS_MAP.get(resultado, "Resultado desconocido")
+        severidad, color_key = SEVERIDAD_MAP.get(resultado, ("DESCONOCIDO", 'dark'))
+        color_severidad = self.colors[color_key]
 
         # Tabla de diagnóstico
         diagnosis_table = [
@@ -475,14 +542,15 @@ class ProfessionalPDFReport:
 
         story.append(Spacer(1, 20))
 
-    def _add_technical_details(self, story: List, diagnosis_data: Dict, confidence_analysis: Dict):
+    def _add_technical_details(self, story: List, diagnosis_data: Dict, confidence_analysis: Dict,
+                               generated_at: datetime):
         """Agrega detalles técnicos"""
         story.append(Paragraph("DETALLES TÉCNICOS", self.styles['SectionHeader']))
 
         technical_info = [
             ["Modelo de IA:", "ResNet50 + Transfer Learning"],
             ["Versión del Sistema:", diagnosis_data.get('modelo_version', 'v2.0')],
-            ["Fecha de Procesamiento:", datetime.now().strftime("%d/%m/%Y %H:%M:%S")],
+            ["Fecha de Procesamiento:", generated_at.strftime("%d/%m/%Y %H:%M:%S")],
             ["ID de Procesamiento:", diagnosis_data.get('processing_id', 'N/A')],
         ]
 
@@ -528,15 +596,7 @@ class ProfessionalPDFReport:
 
     def _get_clinical_interpretation(self, resultado: int, confianza: float) -> str:
         """Genera interpretación clínica del diagnóstico"""
-        interpretations = {
-            0: "No se detectan signos de retinopatía diabética. La retina presenta características normales según el análisis automatizado.",
-            1: "Se detectan signos leves de retinopatía diabética. Recomendable seguimiento periódico y control glucémico estricto.",
-            2: "Retinopatía diabética moderada detectada. Se requiere evaluación oftalmológica especializada y posible intervención.",
-            3: "Retinopatía diabética severa identificada. Necesita atención oftalmológica urgente y evaluación para tratamiento inmediato.",
-            4: "Retinopatía diabética proliferativa detectada. URGENTE: Requiere intervención oftalmológica inmediata para prevenir pérdida visual."
-        }
-
-        base_interpretation = interpretations.get(resultado, "Resultado no reconocido.")
+        base_interpretation = CLINICAL_INTERPRETATIONS.get(resultado, "Resultado no reconocido.")
 
         if confianza < 0.7:
             base_interpretation += " NOTA: La confianza del sistema es moderada-baja, se recomienda especialmente la validación por especialista."
@@ -545,44 +605,8 @@ class ProfessionalPDFReport:
 
     def _generate_clinical_recommendations(self, resultado: int, confianza: float, confidence_analysis: Dict) -> List[str]:
         """Genera recomendaciones clínicas específicas"""
-        recommendations = []
-
-        # Recomendaciones por severidad
-        if resultado == 0:  # Sin retinopatía
-            recommendations = [
-                "Control oftalmológico anual como mínimo",
-                "Mantener control glucémico óptimo (HbA1c < 7%)",
-                "Monitoreo de presión arterial",
-                "Control de lípidos séricos"
-            ]
-        elif resultado == 1:  # Leve
-            recommendations = [
-                "Control oftalmológico cada 6-12 meses",
-                "Optimización del control glucémico",
-                "Control de factores de riesgo cardiovascular",
-                "Educación sobre autocuidado diabético"
-            ]
-        elif resultado == 2:  # Moderada
-            recommendations = [
-                "Evaluación oftalmológica cada 3-6 meses",
-                "Considerar referencia a oftalmólogo especialista en retina",
-                "Control glucémico estricto",
-                "Evaluación de necesidad de tratamiento láser"
-            ]
-        elif resultado == 3:  # Severa
-            recommendations = [
-                "URGENTE: Referencia inmediata a oftalmólogo especialista",
-                "Evaluación para fotocoagulación panretiniana",
-                "Control metabólico estricto",
-                "Seguimiento oftalmológico cada 2-3 meses"
-            ]
-        elif resultado == 4:  # Proliferativa
-            recommendations = [
-                "CRÍTICO: Atención oftalmológica de emergencia",
-                "Evaluación inmediata para vitrectomía si necesario",
-                "Fotocoagulación panretiniana urgente",
-                "Hospitalización si hay hemorragia vítrea"
-            ]
+        # Recomendaciones por severidad (copia: se le agregan las de confianza)
+        recommendations = list(RECOMMENDATIONS_BY_SEVERITY.get(resultado, ()))
 
         # Recomendaciones adicionales por confianza
         if confianza < 0.75:
@@ -595,15 +619,7 @@ class ProfessionalPDFReport:
 
     def _get_followup_schedule(self, resultado: int) -> str:
         """Genera cronograma de seguimiento"""
-        schedules = {
-            0: "Control anual. Próxima evaluación recomendada en 12 meses.",
-            1: "Control semestral. Próxima evaluación en 6 meses, con especialista en 12 meses si no hay cambios.",
-            2: "Control trimestral. Evaluación por especialista en retina dentro de 1-2 meses.",
-            3: "Control mensual. Referencia URGENTE a especialista dentro de 1-2 semanas.",
-            4: "Seguimiento inmediato. Atención de emergencia dentro de 24-48 horas."
-        }
-
-        return schedules.get(resultado, "Consultar con especialista para determinar seguimiento apropiado.")
+        return FOLLOWUP_SCHEDULES.get(resultado, "Consultar con especialista para determinar seguimiento apropiado.")
 
 # Instancia global para fácil uso
 pdf_generator = ProfessionalPDFReport()
\ No newline at end of file
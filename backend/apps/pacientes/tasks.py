@@ -119,23 +119,29 @@ def optimize_uploaded_image_task(imagen_id: int):
             logger.warning(f"Imagen {imagen_id} no tiene archivo")
             return
         
-        # Optimizar imagen
-        optimized_results = ImageOptimizer.optimize_medical_image(imagen.imagen)
+        # Optimizar imagen (solo preview y miniatura: el original ya está guardado)
+        optimized_results = ImageOptimizer.optimize_medical_image(imagen.imagen, include_original=False)
+        
+        # Solo se guardan los campos de esta tarea: process_image_ml_task corre en
+        # paralelo sobre la misma fila y un save() completo pisaría su resultado
+        update_fields = []
         
         # Guardar versiones optimizadas
         if 'preview' in optimized_results:
             imagen.imagen_preview.save(
-                f"preview_{imagen.id}.jpg",
+                f"preview_{imagen.id}.webp",
                 optimized_results['preview'],
                 save=False
             )
+            update_fields.append('imagen_preview')
         
         if 'thumbnail' in optimized_results:
             imagen.imagen_thumbnail.save(
-                f"thumb_{imagen.id}.jpg",
+                f"thumb_{imagen.id}.webp",
                 optimized_results['thumbnail'],
                 save=False
             )
+            update_fields.append('imagen_thumbnail')
         
         # Generar versión WebP
         webp_version = ImageOptimizer.generate_webp_version(imagen.imagen)
@@ -145,12 +151,15 @@ def optimize_uploaded_image_task(imagen_id: int):
                 webp_version,
                 save=False
             )
+            update_fields.append('imagen_webp')
         
-        # Guardar metadata
+        # Guardar metadata (combinada con la que haya escrito la tarea ML)
         if 'metadata' in optimized_results:
-            imagen.metadata = optimized_results['metadata']
+            imagen.metadata = {**_current_metadata(imagen), **optimized_results['metadata']}
+            update_fields.append('metadata')
         
-        imagen.save()
+        if update_fields:
+            imagen.save(update_fields=update_fields)
         
         logger.info(f"Imagen {imagen_id} optimizada exitosamente")
         
@@ -295,18 +304,28 @@ def _update_image_with_result(imagen: ImagenPaciente, result: dict):
     imagen.resultado = result['prediction']
     imagen.modelo_version = result['model_version']
     imagen.fecha_prediccion = timezone.now()
+    update_fields = ['resultado', 'modelo_version', 'fecha_prediccion', 'metadata']
     
     if 'gradcam' in result and result['gradcam']:
         imagen.gradcam_base64 = result['gradcam']
+        update_fields.append('gradcam_base64')
     
-    # Actualizar metadata
-    if not imagen.metadata:
-        imagen.metadata = {}
-    
-    imagen.metadata.update({
+    # Actualizar metadata (combinada con la que haya escrito la optimización)
+    imagen.metadata = {
+        **_current_metadata(imagen),
         'all_probabilities': result.get('all_probabilities', []),
         'is_reliable': result.get('is_reliable', False),
         'processed_at': result.get('processed_at')
-    })
+    }
     
-    imagen.save()
\ No newline at end of file
+    # Solo campos ML: optimize_uploaded_image_task escribe las versiones en paralelo
+    imagen.save(update_fields=update_fields)
+
+
+def _current_metadata(imagen: ImagenPaciente) -> dict:
+    """
+    Metadata vigente en la BD (puede haberla actualizado otra tarea desde que
+    se cargó la instancia), con fallback a la de la instancia
+    """
+    stored = ImagenPaciente.objects.filter(id=imagen.id).values_list('metadata', flat=True).first()
+    return {**(imagen.metadata or {}), **(stored or {})}
\ No newline at end of file
@@ -0,0 +1,228 @@
+import numpy as np
+import tempfile
+import threading
+import time
+import tensorflow as tf
+from unittest.mock import patch, MagicMock
+from django.test import TestCase
+from . import ensemble_predictor
+from .ensemble_predictor import ModelEnsemble, EnsembleMicroBatcher, get_ensemble_manager
+
+
+class _FakeModel:
+    """Modelo mínimo con la interfaz que usa el ensemble (predict y llamada en grafo)"""
+    
+    input_shape = (None, 4, 4, 3)
+    
+    def __init__(self, probs):
+        self.probs = np.asarray(probs, dtype=np.float32)
+        self.predict_calls = 0
+    
+    def predict(self, batch, verbose=0):
+        self.predict_calls += 1
+        return np.tile(self.probs, (len(batch), 1))
+    
+    def __call__(self, batch, training=False):
+        return tf.tile(self.probs[None], [tf.shape(batch)[0], 1])
+
+
+def _loaded_ensemble(models):
+    """Ensemble con los modelos ya materializados, sin pasar por disco"""
+    ensemble = ModelEnsemble(tempfile.mkdtemp())
+    ensemble.models = dict(models)
+    ensemble.model_weights = {name: 1.0 / len(models) for name in models}
+    ensemble.is_loaded = True
+    ensemble._models_materialized = True
+    return ensemble
+
+
+class FusedGraphFallbackTest(TestCase):
+
+    def setUp(self):
+        self.model_a = _FakeModel([0.1, 0.6, 0.1, 0.1, 0.1])
+        self.model_b = _FakeModel([0.7, 0.1, 0.1, 0.05, 0.05])
+        self.ensemble = _loaded_ensemble({'a': self.model_a, 'b': self.model_b})
+        self.batch = np.zeros((2, 4, 4, 3), dtype=np.float32)
+    
+    def test_fused_failure_only_affects_current_call(self):
+        """Un fallo del grafo unido usa los modelos por separado solo en esa llamada"""
+        fused = MagicMock(side_effect=RuntimeError('OOM'))
+        self.ensemble.fused_model = fused
+        self.ensemble.fused_names = ['a', 'b']
+        
+        outputs = self.ensemble._run_models(self.batch)
+        
+        np.testing.assert_allclose(outputs['a'], np.tile(self.model_a.probs, (2, 1)))
+        np.testing.assert_allclose(outputs['b'], np.tile(self.model_b.probs, (2, 1)))
+        self.assertEqual(self.model_a.predict_calls, 1)
+        self.assertIs(self.ensemble.fused_model, fused)
+        
+        # La siguiente llamada vuelve a usar el grafo unido
+        fused.side_effect = None
+        fused.return_value = [tf.constant(np.tile(m.probs, (2, 1))) for m in (self.model_a, self.model_b)]
+        
+        outputs = self.ensemble._run_models(self.batch)
+        
+        self.assertEqual(fused.call_count, 2)
+        self.assertEqual(self.model_a.predict_calls, 1)
+        np.testing.assert_allclose(outputs['b'], np.tile(self.model_b.probs, (2, 1)))
+    
+    def test_fused_graph_matches_per_model_outputs(self):
+        """El grafo unido devuelve lo mismo que cada modelo por separado"""
+        self.ensemble._build_fused_model()
+        self.assertIsNotNone(self.ensemble.fused_model)
+        
+        for size in (1, 3):
+            batch = np.zeros((size, 4, 4, 3), dtype=np.float32)
+            outputs = self.ensemble._run_models(batch)
+            np.testing.assert_allclose(outputs['a'], np.tile(self.model_a.probs, (size, 1)))
+            np.testing.assert_allclose(outputs['b'], np.tile(self.model_b.probs, (size, 1)))
+        
+        self.assertEqual(self.model_a.predict_calls, 0)
+
+
+class EnsembleMicroBatcherTest(TestCase):
+    
+    def setUp(self):
+        self.ensemble = _loaded_ensemble({'a': _FakeModel([0.2] * 5)})
+        # Cada imagen sale del lote con su propio valor como predicción
+        self.ensemble._run_models = MagicMock(
+            side_effect=lambda batch: {'a': batch.reshape(len(batch), -1)[:, :5].copy()}
+        )
+        self.batcher = EnsembleMicroBatcher(self.ensemble, max_batch=4, max_wait=1.0)
+    
+    def test_concurrent_submits_share_one_batch(self):
+        """Los submits concurrentes se ejecutan en un solo lote y cada uno recibe su resultado"""
+        barrier = threading.Barrier(4)
+        results = {}
+        
+        def worker(index):
+            image = np.full((4, 4, 3), index / 10, dtype=np.float32)
+            barrier.wait()
+            results[index] = self.batcher.submit(image).result(timeout=5)
+        
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.ensemble._run_models.assert_called_once()
+        self.assertEqual(self.ensemble._run_models.call_args[0][0].shape, (4, 4, 4, 3))
+        
+        for index in range(4):
+            predictions, confidences = results[index]
+            np.testing.assert_allclose(predictions['a'], np.full(5, index / 10, dtype=np.float32))
+            self.assertAlmostEqual(confidences['a'], index / 10, places=6)
+    
+    def test_exception_reaches_every_future(self):
+        """Un error del lote se propaga a todos los Future que lo componen"""
+        error = RuntimeError('fallo de inferencia')
+        self.ensemble._run_models.side_effect = error
+        
+        futures = [self.batcher.submit(np.zeros((4, 4, 3), dtype=np.float32)) for _ in range(4)]
+        
+        for future in futures:
+            self.assertIs(future.exception(timeout=5), error)
+        self.ensemble._run_models.assert_called_once()
+
+
+@patch.dict(ensemble_predictor._managers, clear=True)
+class GetEnsembleManagerTest(TestCase):
+    
+    @patch.object(ModelEnsemble, 'load_models', return_value=False)
+    def test_failed_setup_is_not_cached(self, mock_load):
+        """Un manager que no pudo cargar no se comparte y se reintenta"""
+        first = get_ensemble_manager('/modelos')
+        second = get_ensemble_manager('/modelos')
+        
+        self.assertFalse(first.is_ready)
+        self.assertIsNot(first, second)
+        self.assertNotIn('/modelos', ensemble_predictor._managers)
+        self.assertEqual(mock_load.call_count, 2)
+    
+    @patch.object(ModelEnsemble, 'load_models', return_value=True)
+    def test_ready_manager_is_shared(self, mock_load):
+        """El manager cargado se reutiliza sin volver a cargar los modelos"""
+        first = get_ensemble_manager('/modelos')
+        second = get_ensemble_manager('/modelos')
+        
+        self.assertTrue(first.is_ready)
+        self.assertIs(first, second)
+        mock_load.assert_called_once_with(preload=True)
+
+
+class DeferredLoadTest(TestCase):
+    
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp()
+        for name in ('modelo_a', 'modelo_b'):
+            open(f"{self.model_dir}/{name}.keras", 'wb').close()
+        self.probs = {
+            'modelo_a': [0.1, 0.6, 0.1, 0.1, 0.1],
+            'modelo_b': [0.05, 0.7, 0.05, 0.1, 0.1],
+        }
+        self.loaded = []
+    
+    def _fake_load(self, path, compile=False):
+        name = path.rsplit('/', 1)[-1].split('.')[0]
+        self.loaded.append(name)
+        # Ensanchar la ventana en la que otro hilo podría cargar en paralelo
+        time.sleep(0.05)
+        return _FakeModel(self.probs[name])
+    
+    def test_registers_without_loading(self):
+        """Sin preload solo se registran las rutas de los modelos"""
+        ensemble = ModelEnsemble(self.model_dir)
+        
+        with patch('apps.pacientes.ensemble_predictor.tf.keras.models.load_model') as mock_load:
+            self.assertTrue(ensemble.load_models(preload=False))
+        
+        mock_load.assert_not_called()
+        self.assertTrue(ensemble.is_loaded)
+        self.assertEqual(sorted(ensemble.models), ['modelo_a', 'modelo_b'])
+    
+    def test_concurrent_first_inference_loads_once(self):
+        """Las primeras inferencias concurrentes cargan cada modelo una sola vez"""
+        ensemble = ModelEnsemble(self.model_dir)
+        image = np.zeros((4, 4, 3), dtype=np.float32)
+        results = []
+        
+        with patch('apps.pacientes.ensemble_predictor.tf.keras.models.load_model', side_effect=self._fake_load):
+            ensemble.load_models(preload=False)
+            barrier = threading.Barrier(4)
+            
+            def worker():
+                barrier.wait()
+                results.append(ensemble.predict_ensemble(image))
+            
+            threads = [threading.Thread(target=worker) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        self.assertEqual(sorted(self.loaded), ['modelo_a', 'modelo_b'])
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertEqual(result['prediction'], 1)
+            self.assertEqual(sorted(result['ensemble_info']['models_used']), ['modelo_a', 'modelo_b'])
+    
+    def test_failed_load_drops_model(self):
+        """Un modelo que no carga se descarta y el resto sigue prediciendo"""
+        ensemble = ModelEnsemble(self.model_dir)
+        
+        def load(path, compile=False):
+            if 'modelo_b' in path:
+                raise OSError('archivo corrupto')
+            return self._fake_load(path)
+        
+        with patch('apps.pacientes.ensemble_predictor.tf.keras.models.load_model', side_effect=load):
+            ensemble.load_models(preload=False)
+            signature = ensemble.models_signature
+            result = ensemble.predict_ensemble(np.zeros((4, 4, 3), dtype=np.float32))
+        
+        self.assertEqual(list(ensemble.models), ['modelo_a'])
+        self.assertEqual(list(ensemble.model_weights), ['modelo_a'])
+        self.assertNotEqual(ensemble.models_signature, signature)
+        self.assertEqual(result['ensemble_info']['models_used'], ['modelo_a'])
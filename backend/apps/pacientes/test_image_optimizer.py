@@ -0,0 +1,64 @@
+from unittest.mock import patch
+from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from io import BytesIO
+from . import image_optimizer
+from .image_optimizer import ImageOptimizer
+
+class OptimizeMedicalImageCacheTest(TestCase):
+
+    def setUp(self):
+        """Limpiar cache y crear una retinografía JPEG de prueba"""
+        cache.clear()
+        
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 1200), color=(180, 60, 30)).save(buffer, 'JPEG', quality=90)
+        self.image_bytes = buffer.getvalue()
+    
+    def _upload(self):
+        return SimpleUploadedFile('retina.jpg', self.image_bytes, content_type='image/jpeg')
+    
+    def test_second_call_served_from_cache(self):
+        """Test que la segunda llamada no decodifica y retorna ContentFile nuevos"""
+        first = ImageOptimizer.optimize_medical_image(self._upload(), include_original=False)
+        
+        with patch.object(image_optimizer.Image, 'open') as mock_open:
+            second = ImageOptimizer.optimize_medical_image(self._upload(), include_original=False)
+        
+        mock_open.assert_not_called()
+        self.assertEqual(second['metadata'], first['metadata'])
+        self.assertNotIn('original', second)
+        
+        for tier in ('preview', 'thumbnail'):
+            self.assertIsInstance(second[tier], ContentFile)
+            self.assertIsNot(second[tier], first[tier])
+            self.assertEqual(second[tier].read(), first[tier].read())
+    
+    def test_original_not_cached(self):
+        """Test que el JPEG a tamaño completo se genera siempre y no se sirve desde cache"""
+        first = ImageOptimizer.optimize_medical_image(self._upload())
+        self.assertIn('original', first)
+        
+        # Los tiers pequeños de esa llamada sí quedaron en cache
+        with patch.object(image_optimizer.Image, 'open') as mock_open:
+            ImageOptimizer.optimize_medical_image(self._upload(), include_original=False)
+        mock_open.assert_not_called()
+        
+        with patch.object(image_optimizer.Image, 'open', wraps=Image.open) as mock_open:
+            second = ImageOptimizer.optimize_medical_image(self._upload())
+        
+        mock_open.assert_called_once()
+        self.assertTrue(second['original'].read().startswith(b'\xff\xd8'))
+    
+    def test_oversized_bundle_not_cached(self):
+        """Test que un bundle mayor que el límite no se cachea"""
+        with patch.object(ImageOptimizer, 'MAX_CACHED_BUNDLE_BYTES', 1):
+            ImageOptimizer.optimize_medical_image(self._upload(), include_original=False)
+            
+            with patch.object(image_optimizer.Image, 'open', wraps=Image.open) as mock_open:
+                ImageOptimizer.optimize_medical_image(self._upload(), include_original=False)
+        
+        mock_open.assert_called_once()
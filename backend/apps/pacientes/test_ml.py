@@ -7,6 +7,7 @@ from PIL import Image
 from io import BytesIO
 from .ml_enhanced import ModelManager, BatchMLProcessor, MLCache, ModelMonitor
 from .models import Paciente, ImagenPaciente
+from .utils import fast_percentiles
 from datetime import date
 
 class ModelManagerTest(TestCase):
@@ -59,25 +60,39 @@ class BatchMLProcessorTest(TestCase):
         """Configurar datos de prueba"""
         self.processor = BatchMLProcessor()
         
-        # Mock del modelo
+        # Mock del modelo (versión actual fija, sin variante cuantizada)
         self.mock_model = MagicMock()
         self.processor.model_manager.models = {'v2.0': self.mock_model}
+        self.processor.model_manager.current_version = 'v2.0'
+        self.processor.model_manager.quantized_models = {}
+        self.processor.model_manager.confidence_threshold = 0.7
     
-    @patch('apps.pacientes.ml_enhanced.Image')
-    def test_load_and_preprocess_image(self, mock_image_class):
+    def _process_chunk(self, predictions, paths=None):
+        """Ejecutar _process_batch_chunk con predicciones reales y carga de imagen simulada"""
+        predictions = np.asarray(predictions, dtype=np.float32)
+        paths = paths or ['test{}.jpg'.format(i) for i in range(len(predictions))]
+        self.mock_model.predict.return_value = predictions
+        
+        def load(path, out=None):
+            # Cada fila queda marcada con su posición de entrada
+            out.fill(paths.index(path))
+            return out
+        
+        with patch.object(self.processor, '_load_and_preprocess_image', side_effect=load):
+            return self.processor._process_batch_chunk(paths)
+    
+    @patch('apps.pacientes.ml_enhanced.cv2.imread')
+    def test_load_and_preprocess_image(self, mock_imread):
         """Test carga y preprocesamiento de imagen"""
-        # Mock de PIL Image
-        mock_image = MagicMock()
-        mock_image.resize.return_value = mock_image
-        mock_image_class.open.return_value = mock_image
-        mock_image_class.open.return_value.convert.return_value = mock_image
-        
-        # Mock numpy array
-        with patch('numpy.array', return_value=np.zeros((512, 512, 3))):
-            result = self.processor._load_and_preprocess_image('fake_path.jpg')
-            
-            self.assertIsNotNone(result)
-            self.assertEqual(result.shape, (512, 512, 3))
+        # Imagen BGR uint8 simulada
+        mock_imread.return_value = np.full((600, 800, 3), 255, dtype=np.uint8)
+        
+        result = self.processor._load_and_preprocess_image('fake_path.jpg')
+        
+        self.assertIsNotNone(result)
+        self.assertEqual(result.shape, (*self.processor.target_size, 3))
+        self.assertEqual(result.dtype, np.float32)
+        self.assertAlmostEqual(float(result.max()), 1.0, places=5)
     
     def test_batch_size_limiting(self):
         """Test limitación de tamaño de batch"""
@@ -95,45 +110,155 @@ class BatchMLProcessorTest(TestCase):
                 chunk_size = len(call[0][0])  # Primer argumento de la llamada
                 self.assertLessEqual(chunk_size, self.processor.max_batch_size)
     
-    @patch('apps.pacientes.ml_enhanced.np')
-    def test_prediction_confidence_threshold(self, mock_np):
+    def test_prediction_confidence_threshold(self):
         """Test aplicación de umbral de confianza"""
-        # Configurar predicciones mock
-        mock_predictions = np.array([[0.1, 0.2, 0.6, 0.05, 0.05]])  # Confianza baja
-        self.mock_model.predict.return_value = mock_predictions
+        results = self._process_chunk([[0.1, 0.2, 0.6, 0.05, 0.05]])  # Confianza baja
         
-        mock_np.array.return_value = np.zeros((1, 512, 512, 3))
-        mock_np.argmax.return_value = 2
-        mock_np.max.return_value = 0.6
+        self.assertEqual(len(results), 1)
+        result = results[0]
         
-        with patch.object(self.processor, '_load_and_preprocess_image', return_value=np.zeros((512, 512, 3))):
-            results = self.processor._process_batch_chunk(['test.jpg'])
-            
-            self.assertEqual(len(results), 1)
-            result = results[0]
-            
-            # Con umbral 0.7, confianza 0.6 no debería ser confiable
-            self.assertFalse(result['is_reliable'])
+        # Con umbral 0.7, confianza 0.6 no debería ser confiable
+        self.assertEqual(result['prediction'], 2)
+        self.assertFalse(result['is_reliable'])
+    
+    def test_vectorized_results_match_per_row(self):
+        """Test argmax, máximo, umbral y redondeo vectorizados iguales al cálculo por fila"""
+        rng = np.random.default_rng(0)
+        logits = rng.normal(scale=3.0, size=(64, 5))
+        predictions = (np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)).astype(np.float32)
+        predictions[0] = [0.0, 0.7, 0.3, 0.0, 0.0]  # Justo en el umbral (0.7 en float32 < 0.7)
+        predictions[1] = [0.2, 0.2, 0.2, 0.2, 0.2]  # Empate: argmax toma la primera clase
+        
+        with patch.object(self.processor, '_generate_gradcam_batch', side_effect=lambda images, preds, **kw: [None] * len(preds)):
+            results = self._process_chunk(predictions)
+        
+        self.assertEqual(len(results), len(predictions))
+        for pred, result in zip(predictions, results):
+            confidence = float(np.max(pred))
+            self.assertEqual(result['prediction'], int(np.argmax(pred)))
+            self.assertEqual(result['confidence'], round(confidence, 4))
+            self.assertEqual(result['all_probabilities'], [round(float(p), 4) for p in pred])
+            self.assertIs(result['is_reliable'], confidence >= 0.7)
+            self.assertIs(type(result['prediction']), int)
     
     def test_gradcam_generation_skipped_low_confidence(self):
         """Test que GradCAM se omite con baja confianza"""
-        mock_predictions = np.array([[0.1, 0.2, 0.5, 0.15, 0.05]])  # Confianza baja
-        self.mock_model.predict.return_value = mock_predictions
-        
-        with patch('apps.pacientes.ml_enhanced.np') as mock_np:
-            mock_np.array.return_value = np.zeros((1, 512, 512, 3))
-            mock_np.argmax.return_value = 2
-            mock_np.max.return_value = 0.5
+        with patch.object(self.processor, '_generate_gradcam_batch') as mock_gradcam:
+            results = self._process_chunk([[0.1, 0.2, 0.5, 0.15, 0.05]])  # Confianza baja
+            
+            # GradCAM no debería haberse llamado
+            mock_gradcam.assert_not_called()
             
-            with patch.object(self.processor, '_load_and_preprocess_image', return_value=np.zeros((512, 512, 3))):
-                with patch.object(self.processor, '_generate_gradcam') as mock_gradcam:
-                    results = self.processor._process_batch_chunk(['test.jpg'])
-                    
-                    # GradCAM no debería haberse llamado
-                    mock_gradcam.assert_not_called()
-                    
-                    result = results[0]
-                    self.assertNotIn('gradcam', result)
+            result = results[0]
+            self.assertNotIn('gradcam', result)
+    
+    def test_gradcam_batched_for_reliable_rows(self):
+        """Test que GradCAM se genera en una sola llamada, solo para las filas confiables"""
+        predictions = [
+            [0.1, 0.2, 0.5, 0.15, 0.05],   # Baja confianza
+            [0.05, 0.05, 0.05, 0.8, 0.05],  # Confiable, clase 3
+            [0.9, 0.05, 0.05, 0.0, 0.0],    # Confiable, clase 0
+        ]
+        with patch.object(self.processor, '_generate_gradcam_batch', return_value=['gc_a', 'gc_b']) as mock_gradcam:
+            results = self._process_chunk(predictions)
+        
+        mock_gradcam.assert_called_once()
+        images, pred_indices = mock_gradcam.call_args[0]
+        self.assertEqual(pred_indices, [3, 0])
+        self.assertEqual(images[:, 0, 0, 0].tolist(), [1.0, 2.0])
+        self.assertEqual(mock_gradcam.call_args[1]['model_version'], 'v2.0')
+        
+        self.assertNotIn('gradcam', results[0])
+        self.assertEqual(results[1]['gradcam'], 'gc_a')
+        self.assertEqual(results[2]['gradcam'], 'gc_b')
+    
+    def test_gradcam_batch_error_keeps_predictions(self):
+        """Test que un fallo de GradCAM no descarta las predicciones del batch"""
+        with patch.object(self.processor, '_generate_gradcam_batch', side_effect=RuntimeError('OOM')):
+            results = self._process_chunk([[0.9, 0.05, 0.05, 0.0, 0.0]])
+        
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0]['is_reliable'])
+        self.assertIsNone(results[0]['gradcam'])
+
+class ProcessImagesBatchTest(TestCase):
+    
+    def setUp(self):
+        """Archivos reales para el hash y un chunk de inferencia simulado"""
+        from django.core.cache import cache
+        cache.clear()
+        
+        self.processor = BatchMLProcessor()
+        self.processor.model_manager.current_version = 'v2.0'
+        
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path_a = self._write_file('a.jpg', b'retina-1')
+        self.path_b = self._write_file('b.jpg', b'retina-1')  # mismo contenido que a
+        self.path_c = self._write_file('c.jpg', b'retina-2')
+    
+    def _write_file(self, name, content):
+        path = '{}/{}'.format(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+    
+    @staticmethod
+    def _fake_chunk(paths, model_version=None):
+        return [
+            {'image_path': path, 'model_version': 'v2.0', 'prediction': i, 'confidence': 0.9}
+            for i, path in enumerate(paths)
+        ]
+    
+    def test_duplicate_images_inferred_once(self):
+        """Test que las imágenes repetidas se infieren una vez y conservan su ruta"""
+        with patch.object(self.processor, '_process_batch_chunk', side_effect=self._fake_chunk) as mock_chunk:
+            results = self.processor.process_images_batch([self.path_a, self.path_c, self.path_b])
+        
+        mock_chunk.assert_called_once()
+        self.assertEqual(mock_chunk.call_args[0][0], [self.path_a, self.path_c])
+        
+        self.assertEqual([r['image_path'] for r in results], [self.path_a, self.path_c, self.path_b])
+        self.assertEqual(results[2]['prediction'], results[0]['prediction'])
+        self.assertNotEqual(results[1]['prediction'], results[0]['prediction'])
+    
+    def test_cache_hit_skips_inference(self):
+        """Test que una imagen ya cacheada no pasa por el modelo"""
+        with patch.object(self.processor, '_process_batch_chunk', side_effect=self._fake_chunk) as mock_chunk:
+            first = self.processor.process_images_batch([self.path_a])
+            second = self.processor.process_images_batch([self.path_b])
+        
+        mock_chunk.assert_called_once()
+        self.assertEqual(second[0]['image_path'], self.path_b)
+        self.assertEqual(second[0]['prediction'], first[0]['prediction'])
+    
+    def test_unreadable_file_still_processed(self):
+        """Test que un archivo sin hash se procesa igual y no se cachea ni se agrupa"""
+        missing = '{}/no_existe.jpg'.format(self.tmp_dir)
+        
+        with patch.object(self.processor, '_process_batch_chunk', side_effect=self._fake_chunk) as mock_chunk, \
+                patch.object(MLCache, 'cache_prediction') as mock_cache:
+            results = self.processor.process_images_batch([missing, missing])
+        
+        self.assertEqual(mock_chunk.call_args[0][0], [missing, missing])
+        self.assertEqual(len(results), 2)
+        mock_cache.assert_not_called()
+
+class FastPercentilesTest(TestCase):
+    
+    def test_matches_np_percentile(self):
+        """Test que fast_percentiles coincide con np.percentile a cualquier tamaño"""
+        rng = np.random.default_rng(0)
+        quantiles = (0.5, 2, 98, 99.5)
+        
+        for size in (1, 7, 96 * 96, 512 * 512):
+            values = (rng.random(size, dtype=np.float32) ** 3).reshape(-1, 1)
+            np.testing.assert_allclose(
+                fast_percentiles(values, quantiles), np.percentile(values, quantiles), rtol=1e-6
+            )
+    
+    def test_constant_values(self):
+        """Test con todos los valores iguales"""
+        self.assertEqual(fast_percentiles(np.full((4, 4), 0.25, dtype=np.float32), (2, 98)), [0.25, 0.25])
 
 class MLCacheTest(TestCase):
     
@@ -267,6 +392,147 @@ class ModelMonitorTest(TestCase):
         self.assertEqual(class_dist['0'], 80)
         self.assertEqual(class_dist['1'], 20)
 
+class FakeRedis:
+    """Redis en memoria con los comandos que usa ModelMonitor (respuestas en bytes)"""
+    
+    def __init__(self):
+        self.hashes = {}
+        self.lists = {}
+        self.pipelines = []
+    
+    def pipeline(self):
+        pipe = FakeRedisPipeline(self)
+        self.pipelines.append(pipe)
+        return pipe
+    
+    def hincrby(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = str(int(values.get(field, 0)) + amount)
+    
+    def hincrbyfloat(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = repr(float(values.get(field, 0)) + amount)
+    
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = str(value)
+    
+    def expire(self, key, seconds):
+        pass
+    
+    def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, value)
+    
+    def ltrim(self, key, start, end):
+        self.lists[key] = self.lists.get(key, [])[start:end + 1]
+    
+    def hgetall(self, key):
+        return {k.encode(): v.encode() for k, v in self.hashes.get(key, {}).items()}
+    
+    def lrange(self, key, start, end):
+        return [item.encode() for item in self.lists.get(key, [])[start:end + 1]]
+
+class FakeRedisPipeline:
+    """Encola los comandos y los aplica todos en execute()"""
+    
+    def __init__(self, redis_conn):
+        self.redis_conn = redis_conn
+        self.commands = []
+        self.executed = False
+    
+    def __getattr__(self, name):
+        def queue_command(*args):
+            self.commands.append((name, args))
+        return queue_command
+    
+    def execute(self):
+        for name, args in self.commands:
+            getattr(self.redis_conn, name)(*args)
+        self.executed = True
+
+class ModelMonitorRedisTest(TestCase):
+    
+    PREDICTIONS = [
+        {'prediction': 0, 'confidence': 0.9, 'is_reliable': True},
+        {'prediction': 3, 'confidence': 0.8, 'is_reliable': True},
+        {'prediction': 0, 'confidence': 0.6, 'is_reliable': False},
+    ]
+    
+    def setUp(self):
+        """Monitor con cliente Redis falso y otro forzado al cache de Django"""
+        from django.core.cache import cache
+        cache.clear()
+        
+        self.redis_conn = FakeRedis()
+        self.monitor = self._monitor(self.redis_conn)
+        self.cache_monitor = self._monitor(None)
+    
+    @staticmethod
+    def _monitor(redis_conn):
+        monitor = ModelMonitor()
+        monitor._redis = redis_conn
+        monitor._redis_checked = True
+        return monitor
+    
+    def test_log_prediction_single_pipeline(self):
+        """Test que cada predicción es un solo pipeline con contadores y ring buffer"""
+        self.monitor.log_prediction(self.PREDICTIONS[2])
+        
+        self.assertEqual(len(self.redis_conn.pipelines), 1)
+        pipe = self.redis_conn.pipelines[0]
+        self.assertTrue(pipe.executed)
+        
+        commands = [(name, args[1] if name.startswith('h') else None) for name, args in pipe.commands]
+        self.assertIn(('hincrby', 'total_predictions'), commands)
+        self.assertIn(('hincrbyfloat', 'confidence_sum'), commands)
+        self.assertIn(('hincrby', 'class_0'), commands)
+        self.assertIn(('hincrby', 'low_confidence_count'), commands)
+        
+        names = [name for name, _ in pipe.commands]
+        self.assertEqual(names[names.index('lpush') + 1], 'ltrim')
+        self.assertIn(('ltrim', ('ml:recent', 0, ModelMonitor.MAX_RECENT_PREDICTIONS - 1)), pipe.commands)
+    
+    def test_redis_metrics_match_cache_shape(self):
+        """Test que las métricas desde Redis tienen la misma forma que las del cache"""
+        for pred in self.PREDICTIONS:
+            self.monitor.log_prediction(pred)
+            self.cache_monitor.log_prediction(pred)
+        
+        metrics = self.monitor.get_model_metrics()
+        cache_metrics = self.cache_monitor.get_model_metrics()
+        
+        self.assertEqual(set(metrics), set(cache_metrics))
+        self.assertEqual(metrics['class_distribution'], {'0': 2, '1': 0, '2': 0, '3': 1, '4': 0})
+        self.assertEqual(metrics['class_distribution'], cache_metrics['class_distribution'])
+        self.assertEqual(metrics['total_predictions'], 3)
+        self.assertEqual(metrics['low_confidence_count'], 1)
+        self.assertAlmostEqual(metrics['avg_confidence'], cache_metrics['avg_confidence'], places=9)
+        self.assertIsInstance(metrics['total_predictions'], int)
+    
+    def test_empty_redis_metrics(self):
+        """Test que sin predicciones registradas se retorna un dict vacío"""
+        self.assertEqual(self.monitor.get_model_metrics(), {})
+    
+    def test_recent_predictions_oldest_first(self):
+        """Test que las predicciones recientes salen de la más antigua a la más nueva"""
+        for i in range(5):
+            self.monitor.log_prediction({'prediction': i, 'confidence': 0.8, 'is_reliable': True})
+        
+        recent = self.monitor.get_recent_predictions()
+        self.assertEqual([p['prediction'] for p in recent], [0, 1, 2, 3, 4])
+        
+        # Con límite: las más nuevas, en el mismo orden que el fallback de cache
+        recent = self.monitor.get_recent_predictions(2)
+        self.assertEqual([p['prediction'] for p in recent], [3, 4])
+    
+    @patch.object(ModelMonitor, 'MAX_RECENT_PREDICTIONS', 3)
+    def test_recent_predictions_ring_buffer(self):
+        """Test que LTRIM conserva solo las últimas predicciones"""
+        for i in range(5):
+            self.monitor.log_prediction({'prediction': i, 'confidence': 0.8, 'is_reliable': True})
+        
+        recent = self.monitor.get_recent_predictions()
+        self.assertEqual([p['prediction'] for p in recent], [2, 3, 4])
+
 @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
 class IntegrationMLTest(TestCase):
     """Tests de integración ML con modelos Django"""
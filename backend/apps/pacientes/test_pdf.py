@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from django.test import TestCase
+from . import pdf_generator
+from .pdf_generator import generate_report, generate_reports_bulk
+
+def _reporte_data(reporte_id):
+    """Datos mínimos válidos para un reporte"""
+    return {
+        'metadatos': {'reporte_id': reporte_id, 'generado_por': 'tests'},
+        'paciente': {
+            'nombres': 'Ana',
+            'apellidos': 'Pérez',
+            'ci': '1234567',
+            'historia_clinica': 'HC001',
+            'edad': 54,
+            'genero': 'Femenino',
+            'tipo_diabetes': 'Tipo 2',
+        },
+        'diagnostico': {
+            'resultado': 'Leve',
+            'confianza_pct': 88.5,
+            'fecha_diagnostico': '15/10/2026 10:00',
+            'modelo_version': 'v2.0',
+        },
+        'imagenes': {},
+        'plan_tratamiento': {'plan_sugerido': 'Control anual'},
+    }
+
+class GenerateReportsBulkTest(TestCase):
+
+    def _fake_report(self, reporte_data):
+        # Los primeros reportes terminan últimos: el orden no depende de cuál acaba antes
+        reporte_id = reporte_data['metadatos']['reporte_id']
+        time.sleep(0.02 * (3 - int(reporte_id)))
+        return reporte_id.encode()
+    
+    def test_empty_input(self):
+        """Test que sin reportes se retorna una lista vacía sin crear el pool"""
+        with patch.object(pdf_generator, 'ProcessPoolExecutor') as mock_pool:
+            self.assertEqual(generate_reports_bulk([]), [])
+        
+        mock_pool.assert_not_called()
+    
+    def test_single_worker_skips_pool(self):
+        """Test que con un solo worker se genera en el mismo proceso"""
+        with patch.object(pdf_generator, 'ProcessPoolExecutor') as mock_pool, \
+                patch.object(pdf_generator, 'generate_report', side_effect=self._fake_report):
+            pdfs = generate_reports_bulk([_reporte_data(str(i)) for i in range(3)], max_workers=1)
+        
+        mock_pool.assert_not_called()
+        self.assertEqual(pdfs, [b'0', b'1', b'2'])
+    
+    def test_pool_preserves_order(self):
+        """Test que el pool devuelve los PDFs en el orden de entrada"""
+        with patch.object(pdf_generator, 'ProcessPoolExecutor', ThreadPoolExecutor), \
+                patch.object(pdf_generator, 'generate_report', side_effect=self._fake_report):
+            pdfs = generate_reports_bulk([_reporte_data(str(i)) for i in range(3)], max_workers=3)
+        
+        self.assertEqual(pdfs, [b'0', b'1', b'2'])
+    
+    def test_process_pool_generates_pdfs(self):
+        """Test que el worker se serializa al pool y cada proceso genera un PDF válido"""
+        pdfs = generate_reports_bulk([_reporte_data('A'), _reporte_data('B')], max_workers=2)
+        
+        self.assertEqual(len(pdfs), 2)
+        for pdf in pdfs:
+            self.assertTrue(pdf.startswith(b'%PDF-'))
+    
+    def test_generate_report_returns_bytes(self):
+        """Test del camino síncrono de un solo reporte"""
+        pdf = generate_report(_reporte_data('A'))
+        
+        self.assertTrue(pdf.startswith(b'%PDF-'))
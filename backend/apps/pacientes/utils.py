@@ -5,9 +5,29 @@ from PIL import Image
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import InMemoryUploadedFile
 import logging
+from typing import List, Sequence
 
 logger = logging.getLogger(__name__)
 
+def fast_percentiles(values: np.ndarray, quantiles: Sequence[float]) -> List[float]:
+    """
+    Percentiles exactos, con la misma interpolación lineal que np.percentile, pero
+    con una única selección parcial (np.partition) sobre los índices necesarios:
+    más rápido que np.percentile y sin perder precisión a ningún tamaño
+    """
+    flat = np.asarray(values).ravel()
+    last = flat.size - 1
+    positions = [q / 100.0 * last for q in quantiles]
+    kth = sorted({k for pos in positions for k in (int(pos), min(int(pos) + 1, last))})
+    part = np.partition(flat, kth)
+
+    result = []
+    for pos in positions:
+        lower = int(pos)
+        upper = min(lower + 1, last)
+        result.append(float(part[lower] + (part[upper] - part[lower]) * (pos - lower)))
+    return result
+
 def preprocess_retina_image_file(file: InMemoryUploadedFile, target_size=(512, 512)):
     # 🔁 Reiniciar puntero del archivo
     file.seek(0)
@@ -1,5 +1,6 @@
 import os
 import base64
+import zipfile
 import numpy as np
 import cv2
 from PIL import Image as PILImage
@@ -32,8 +33,9 @@ logger = logging.getLogger(__name__)
 # Importar sistemas mejorados
 try:
     from .confidence_enhancer import enhanced_confidence_system
-    from .ensemble_predictor import EnsembleManager
+    from .ensemble_predictor import get_ensemble_manager
     from .pdf_professional_report import pdf_generator
+    from .pdf_generator import generate_reports_bulk
     ENHANCED_SYSTEMS_AVAILABLE = True
     logger.info("✅ Sistemas mejorados cargados exitosamente")
 except ImportError as e:
@@ -298,7 +300,7 @@ def upload_imagen_paciente(request, paciente_id):
             'message': 'Imagen subida correctamente',
             'imagen_id': imagen.id,
             'status': 'processing'
-        }, status=status.HTTP_201_CREATED)
+        }, status=status.HTTP_202_ACCEPTED)
         
     except Exception as e:
         logger.error(f"Error subiendo imagen: {e}")
@@ -964,15 +966,17 @@ def enhanced_prediction(request):
         try:
             if use_ensemble:
                 # Usar ensemble si está disponible
-                ensemble_manager = EnsembleManager(os.path.join(settings.BASE_DIR, 'apps/pacientes/modelos'))
-                if not ensemble_manager.setup():
+                ensemble_manager = get_ensemble_manager(os.path.join(settings.BASE_DIR, 'apps/pacientes/modelos'))
+                if not ensemble_manager.is_ready:
                     # Fallback a sistema mejorado individual
                     result = enhanced_confidence_system.predict_with_enhanced_confidence(
                         model, processed_image, use_tta=use_tta
                     )
                     result['method'] = 'enhanced_individual'
                 else:
-                    result = ensemble_manager.predict(processed_image, method="weighted_average")
+                    result = ensemble_manager.predict(
+                        processed_image, method="weighted_average", use_cache=True
+                    )
                     result['method'] = 'ensemble'
             else:
                 # Sistema mejorado individual
@@ -1101,9 +1105,13 @@ def generate_patient_pdf_report(request, paciente_id):
 def generate_batch_pdf_reports(request):
     """
     Genera múltiples reportes PDF para una lista de pacientes
+
+    Con formato='zip' devuelve los PDFs en un ZIP, generados en paralelo con
+    generate_reports_bulk; por defecto solo lista las URLs de cada reporte
     """
     try:
         paciente_ids = request.data.get('paciente_ids', [])
+        formato = request.data.get('formato', 'json')
 
         if not paciente_ids or not isinstance(paciente_ids, list):
             return Response(
@@ -1111,17 +1119,27 @@ def generate_batch_pdf_reports(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        if formato == 'zip' and not ENHANCED_SYSTEMS_AVAILABLE:
+            return Response(
+                {'error': 'Sistemas mejorados no disponibles'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
         results = []
         errors = []
+        diagnosticos = []
 
         for paciente_id in paciente_ids:
             try:
                 paciente = Paciente.objects.get(id=paciente_id)
 
                 # Verificar si tiene diagnósticos
-                has_diagnosis = paciente.imagenes.filter(resultado__isnull=False).exists()
+                imagen_reciente = paciente.imagenes.filter(
+                    resultado__isnull=False
+                ).order_by('-fecha_prediccion').first()
 
-                if has_diagnosis:
+                if imagen_reciente:
+                    diagnosticos.append((paciente, imagen_reciente))
                     results.append({
                         'paciente_id': paciente_id,
                         'nombre': f"{paciente.nombres} {paciente.apellidos}",
@@ -1146,6 +1164,14 @@ def generate_batch_pdf_reports(request):
                     'error': str(e)
                 })
 
+        if formato == 'zip':
+            if not diagnosticos:
+                return Response(
+                    {'error': 'Ningún paciente tiene diagnósticos disponibles', 'error_details': errors},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return _bulk_pdf_zip_response(diagnosticos, request.user)
+
         return Response({
             'generated_reports': len(results),
             'errors': len(errors),
@@ -1162,3 +1188,69 @@ def generate_batch_pdf_reports(request):
         )
 
 
+def _bulk_pdf_zip_response(diagnosticos, user):
+    """ZIP con un reporte PDF por paciente (paciente, imagen diagnosticada más reciente)"""
+    pdfs = generate_reports_bulk(
+        [_bulk_reporte_data(paciente, imagen, user) for paciente, imagen in diagnosticos]
+    )
+
+    # Los PDFs ya vienen comprimidos: se guardan sin recomprimir
+    zip_buffer = BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_STORED) as zip_file:
+        for (paciente, _), pdf_content in zip(diagnosticos, pdfs):
+            zip_file.writestr(f"reporte_{paciente.ci}.pdf", pdf_content)
+
+    response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
+    filename = f"reportes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+    logger.info(f"✅ ZIP con {len(pdfs)} reportes PDF generado")
+
+    return response
+
+
+def _bulk_reporte_data(paciente, imagen, user):
+    """reporte_data de pdf_generator a partir del último diagnóstico del paciente"""
+    fecha_diagnostico = imagen.fecha_prediccion or imagen.fecha_creacion
+
+    # confianza se guarda como probabilidad (0-1); sin ella se usa la máxima registrada
+    confianza = imagen.confianza
+    if confianza is None:
+        confianza = max((imagen.metadata or {}).get('all_probabilities') or [0])
+    confianza_pct = confianza * 100 if confianza <= 1 else confianza
+
+    hoy = datetime.now().date()
+    nacimiento = paciente.fecha_nacimiento
+    edad = hoy.year - nacimiento.year - ((hoy.month, hoy.day) < (nacimiento.month, nacimiento.day))
+
+    return {
+        'metadatos': {
+            'reporte_id': f"RPT_{paciente.id}_{imagen.id}",
+            'generado_por': user.get_username() or 'Sistema',
+        },
+        'paciente': {
+            'nombres': paciente.nombres,
+            'apellidos': paciente.apellidos,
+            'ci': paciente.ci,
+            'historia_clinica': paciente.historia_clinica,
+            'edad': edad,
+            'genero': paciente.get_genero_display(),
+            'tipo_diabetes': paciente.get_tipo_diabetes_display(),
+        },
+        'diagnostico': {
+            'resultado': imagen.get_resultado_display(),
+            'confianza_pct': confianza_pct,
+            'fecha_diagnostico': fecha_diagnostico.strftime('%d/%m/%Y %H:%M'),
+            'modelo_version': imagen.modelo_version,
+        },
+        'imagenes': {
+            'retina_url': imagen.imagen.path if imagen.imagen else None,
+            'gradcam_base64': imagen.gradcam_base64,
+            'gradcam_url': imagen.gradcam.path if imagen.gradcam else None,
+        },
+        'plan_tratamiento': {
+            'plan_sugerido': 'A definir por el especialista tratante',
+        },
+    }
+
+